@@ -1,10 +1,15 @@
 """Intersect ARD Tile Grid and clip scenes."""
 
 import os
+import signal
 import logging
-import time
 import glob
 import shutil
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
+
+import numpy as np
 
 import db
 import util
@@ -13,12 +18,26 @@ import config
 import landsat
 import external
 import geofuncs
+import warp
 from ARD_regionLU import pathrow2regionLU
 from ARD_metadata import buildMetadata
 
 
+# Scene bundle members needed locally to build the tile metadata
+SCENE_METADATA_PATTERNS = ('*.xml', '*_MTL.txt')
+
+# Scene band used to determine each scene's footprint in LINEAGEQA
+LINEAGE_BAND = 'toa_band1'
+
+# Output bands whose value histogram is counted in memory before they are
+# written, with the number of distinct values each can hold
+HISTOGRAM_BINS = {
+    'PIXELQA': 65536,
+}
+
 def process_tile(current_tile, tile_id, segment, region,
-                 tiles_contrib_scenes, output_path, conf):
+                 tiles_contrib_scenes, scene_files, patterns, output_path,
+                 conf, engine, band_pool=None):
     """Process each tile needed for segment.
 
     Args:
@@ -27,8 +46,13 @@ def process_tile(current_tile, tile_id, segment, region,
         segment (dict): information about a scene
         region (str): ARD grid tile area (e.g. CU, AK, HI)
         tiles_contrib_scenes (list): neighboring scene details
+        scene_files (dict): contributing scene files, by scene wildcard
+        patterns (tuple): scene bundle members to unpack
         output_path (str): path to store outputs
         conf (dict): runtime configuration options
+        engine (warp.WarpEngine): clipping engine shared by the segment
+        band_pool (ThreadPool): threads shared by the segment to process
+            bands concurrently, or None to process them in turn
 
     """
     production_timestamp = landsat.get_production_timestamp()
@@ -37,14 +61,6 @@ def process_tile(current_tile, tile_id, segment, region,
     logger.debug("tile_id: %s", tile_id)
     logger.debug("clip_extents: %s", clip_extents)
 
-    # See if tile_id exists in ARD_COMPLETED_TILES table
-    tile_rec = db.check_tile_status(db.connect(conf.connstr), tile_id)
-    logger.debug("Tile status: %s", tile_rec)
-
-    if tile_rec:
-        logger.error('Tile already created! %s', tile_rec)
-        raise ArdTileException
-
     logger.info("Create Tile %s", tile_id)
 
     # Get file location for scenes that will contribute to the tile
@@ -68,16 +84,9 @@ def process_tile(current_tile, tile_id, segment, region,
             contributing_scenes.update(provided_contrib_rec)
 
         if not provided_contrib_rec:
-            db_contrib_rec = db.fetch_file_loc(db.connect(conf.connstr),
-                                               sat=segment['SATELLITE'],
-                                               wildcard=wildcard)
-            logger.debug('Fetch file locations from DB: %s', db_contrib_rec)
+            db_contrib_rec = scene_files.get(wildcard)
+            logger.debug('File locations from DB: %s', db_contrib_rec)
             if db_contrib_rec:
-                db_contrib_rec = {
-                    r['LANDSAT_PRODUCT_ID']: util.ffind(r['FILE_LOC'])
-                    for r in db_contrib_rec
-                }
-
                 # If any of the scenes can't be found, raise an exception.
                 if None in db_contrib_rec.values():
                     logger.error("Error finding file for %s",
@@ -105,13 +114,16 @@ def process_tile(current_tile, tile_id, segment, region,
         # Stage files to disk cache for faster access
         external.stage_files(contributing_scenes.values(), conf.soap_envelope)
 
-    # If each contributing scene is not already unpacked, do it here
+    producers = config.read_processing_config(sensor=segment['SATELLITE'])
+
+    # If each contributing scene is not already unpacked, do it here.
+    sources = dict()
     for product_id, tar_file_location in contributing_scenes.items():
 
         logger.info('Required Scene: %s', tar_file_location)
         try:
-            directory = os.path.join(conf.workdir, product_id)
-            util.untar_archive(tar_file_location, directory=directory)
+            sources[product_id] = unpack_scene(product_id, tar_file_location,
+                                               patterns, conf)
         except Exception:
             logger.exception('Error staging input data for %s: %s',
                              product_id, tar_file_location)
@@ -123,14 +135,13 @@ def process_tile(current_tile, tile_id, segment, region,
     # North scenes (--row#) will always overlay South scenes (++row#).
     # The row values are characters 13 - 15 in the product ID.
     stacking = [{'LANDSAT_PRODUCT_ID': name,
-                 'XML_LOC': util.ffind(conf.workdir, name, '*.xml')}
+                 'XML_LOC': util.ffind(conf.workdir, name, '*.xml'),
+                 'SOURCE': sources[name]}
                 for name in sorted(contributing_scenes,
                                    key=lambda x: x[13:])]
 
     util.make_dirs(os.path.join(conf.workdir, tile_id))
 
-    producers = config.read_processing_config(sensor=segment['SATELLITE'])
-
     datatypes = {
         "[ TYPE: Int16 ][ RANGE: -100,16000 ][ FILL: -9999 ]":
             direct_clip,
@@ -154,7 +165,33 @@ def process_tile(current_tile, tile_id, segment, region,
             calc_nodata_9999_lineage,
     }
 
+    # WARNING: Assume LINEAGE will always be present!
+    # The lineage is built once and shared by all lineage-dependent bands,
+    # which select scenes by their stacking level.
+    lineage_filename, lineage, template = (
+        process_lineage(stacking, LINEAGE_BAND, clip_extents,
+                        tile_id, 'LINEAGEQA', conf.workdir, engine)
+    )
+
+    # Value histograms of the outputs, each counted once per tile
+    histograms = dict()
+    histograms['LINEAGEQA'] = np.bincount(lineage.ravel(), minlength=256)
+
+    # Renumber the stored lineage to the scenes which contributed pixels,
+    # before clipping any band of a tile which turns out to be all fill
+    lng_count, remap = process_lineage_contributing(histograms['LINEAGEQA'],
+                                                    n_contrib_scenes)
+    if remap is not None:
+        histograms['LINEAGEQA'] = np.bincount(
+            remap, weights=histograms['LINEAGEQA'],
+            minlength=256).astype(np.int64)
+
     outputs = dict()
+    outputs['LINEAGEQA'] = write_lineage(lineage_filename, lineage, template,
+                                         remap, engine)
+
+    # Bands shared by several products are only processed once
+    band_jobs = OrderedDict()
     for product_request in sorted(conf.products, reverse=True):
         logging.info('Create product %s', product_request)
         required_bands = config.determine_output_products(producers,
@@ -163,30 +200,35 @@ def process_tile(current_tile, tile_id, segment, region,
             dtype = config.datatype_searches(producers, band_name)
             logger.info('Requires base band_name %s (Type %s)',
                         band_name, dtype)
-
-            # Process the current dataset type
-            filename = datatypes[dtype](stacking, band_name, clip_extents,
-                                        tile_id, rename, conf.workdir)
-            outputs[band_name] = filename
-
-            # WARNING: Assume LINEAGE will always be present!
-            if band_name == 'toa_band1':
-                outputs['LINEAGEQA'] = (
-                    process_lineage(stacking, band_name, clip_extents,
-                                    tile_id, 'LINEAGEQA', conf.workdir)
-                )
-
-    lng_count = process_lineage_contributing(outputs['LINEAGEQA'],
-                                             n_contrib_scenes)
+            band_jobs[band_name] = (datatypes[dtype], rename)
+
+    def process_band(band_name):
+        """Process the current dataset type, with its value histogram."""
+        processor, rename = band_jobs[band_name]
+        filename, histogram = processor(stacking, band_name, clip_extents,
+                                        tile_id, rename, conf.workdir, engine,
+                                        lineage)
+        return band_name, rename, filename, histogram
+
+    # Every band depends only on the LINEAGEQA built above
+    if band_pool is not None:
+        logger.info('Processing %d bands concurrently', len(band_jobs))
+        results = band_pool.map(process_band, band_jobs, chunksize=1)
+    else:
+        results = map(process_band, band_jobs)
+    for band_name, rename, filename, histogram in results:
+        outputs[band_name] = filename
+        if histogram is not None:
+            histograms[rename] = histogram
 
     outputs['XML'] = (
         process_metadata(segment, stacking, tile_id, clip_extents, region,
                          lng_count, production_timestamp, producers,
-                         conf.workdir)
+                         conf.workdir, histograms.get('PIXELQA'))
     )
 
-    if process_output(conf.products, producers, outputs, conf.workdir, tile_id,
-                      output_path) != 0:
+    if process_output(conf.products, producers, outputs, tile_id,
+                      output_path, workers=conf.package_workers) != 0:
         logger.error('Failed processing products.')
         return "ERROR"
     if process_browse(producers['browse'], conf.workdir, tile_id,
@@ -204,39 +246,100 @@ def process_tile(current_tile, tile_id, segment, region,
     return "SUCCESS"
 
 
-def direct_clip(stacking, band_name, clip_extents, tile_id, rename, workdir):
-    """Clip datatypes which require no special processing."""
+def scene_member_patterns(producers, conf):
+    """Scene bundle members to unpack for the requested products."""
+    if conf.input_mode == 'vsitar':
+        return SCENE_METADATA_PATTERNS
+    bands = config.determine_required_bands(producers, conf.products)
+    bands = set(bands) | {LINEAGE_BAND}
+    return (SCENE_METADATA_PATTERNS +
+            tuple('*' + band + '.tif' for band in sorted(bands)))
+
+
+def unpack_scene(product_id, tar_file_location, patterns, conf):
+    """Unpack a scene bundle into the work directory, per the input mode.
+
+    With input_mode 'vsitar' the bundle is decompressed once into a plain
+    tar, which its bands are read from in place, and only the metadata
+    members are unpacked.
+
+    Returns:
+        str: location the scene's bands are read from
+
+    """
+    directory = os.path.join(conf.workdir, product_id)
+    archive, decompressor = tar_file_location, conf.decompressor
+    if conf.input_mode == 'vsitar':
+        archive = util.inflate_archive(tar_file_location, directory + '.tar',
+                                       decompressor=conf.decompressor)
+        decompressor = 'tarfile'
+    util.untar_archive(archive, directory=directory, patterns=patterns,
+                       decompressor=decompressor)
+    if conf.input_mode == 'vsitar':
+        return '/vsitar/' + os.path.abspath(archive)
+    return directory
+
+
+def remove_scene(product_id):
+    """Remove a scene's unpacked files from the work directory."""
+    util.remove(product_id, product_id + '.lock',
+                product_id + '.tar', product_id + '.tar.lock')
+
+
+def direct_clip(stacking, band_name, clip_extents, tile_id, rename, workdir,
+                engine, lineage):
+    """Clip datatypes which require no special processing.
+
+    The mosaic is clipped into memory, where the values of bands listed in
+    HISTOGRAM_BINS are counted, and written once through the engine's
+    output profile.
+
+    Returns:
+        str: path to the clipped band
+        numpy.ndarray: pixel count of each value, or None if not counted
+
+    """
     logger.info('     Start processing for band: %s', band_name)
     mosaic_filename = os.path.join(workdir, tile_id,
                                    tile_id + '_' + rename + '.tif')
 
     if os.path.exists(mosaic_filename):
         logger.warning("Skip previously generated result %s", mosaic_filename)
-        return mosaic_filename
-
-    warp_cmd = (
-        'gdalwarp -te {extents}'
-        ' -co "compress=deflate" -co "zlevel=9"'
-        ' -co "tiled=yes" -co "predictor=2"'
-    ).format(extents=clip_extents)
-
-    for stack in reversed(stacking):
-        scene_name = util.ffind(workdir, stack['LANDSAT_PRODUCT_ID'],
-                                '*' + band_name + '.tif')
-        warp_cmd += ' ' + scene_name
-    warp_cmd += ' ' + mosaic_filename
-    util.execute_cmd(warp_cmd)
+        return mosaic_filename, None
+
+    scene_names = [geofuncs.find_scene_band(stack['SOURCE'], band_name)
+                   for stack in reversed(stacking)]
+    clipped = engine.warp_to_memory(
+        scene_names, mosaic_filename.replace('.tif', '_scratch.tif'),
+        extents=clip_extents)
+    histogram = None
+    if rename in HISTOGRAM_BINS:
+        histogram = np.bincount(
+            clipped.GetRasterBand(1).ReadAsArray().ravel(),
+            minlength=HISTOGRAM_BINS[rename])
+    engine.profile.write(clipped, mosaic_filename)
 
     logger.info('    End processing for %s as %s ', band_name, mosaic_filename)
     if not os.path.exists(mosaic_filename):
         logger.error('Processing failed to generate desired output: %s',
                      mosaic_filename)
-    return mosaic_filename
+    return mosaic_filename, histogram
 
 
 def process_lineage(stacking, band_name, clip_extents,
-                    tile_id, rename, workdir):
-    """Create the lineage file."""
+                    tile_id, rename, workdir, engine):
+    """Build the lineage levels in memory, ready to be finalized.
+
+    Each pixel is assigned the stacking level of the northern-most scene
+    with valid (> -101) data in band_name, or 0 if no scene covers it.
+
+    Returns:
+        str: path the lineage file is written to
+        numpy.ndarray: lineage levels
+        gdal.Dataset: clipped dataset giving the lineage's geolocation, or
+            None if the lineage file was already generated
+
+    """
     logger.info('     Start processing for band: %s', rename)
 
     lineage_filename = os.path.join(workdir, tile_id,
@@ -244,51 +347,44 @@ def process_lineage(stacking, band_name, clip_extents,
 
     if os.path.exists(lineage_filename):
         logger.warning("Skip previously generated result %s", lineage_filename)
-        return lineage_filename
+        return (lineage_filename, geofuncs.read_array(lineage_filename),
+                None)
 
-    temp_names = list()
-    for level, stack in reversed(list(enumerate(stacking, start=1))):
+    lineage = None
+    for level, stack in enumerate(stacking, start=1):
+        scene_name = geofuncs.find_scene_band(stack['SOURCE'], band_name)
         temp_name = lineage_filename.replace('.tif',
                                              '_srcTemp%d' % level + '.tif')
-        scene_name = util.ffind(workdir, stack['LANDSAT_PRODUCT_ID'],
-                                '*' + band_name + '.tif')
-
-        calc_cmd = (
-            'gdal_calc.py -A {scene} --outfile {temp}'
-            ' --calc=" {level} * (A > -101)" --type="Byte" --NoDataValue=0'
-        )
-        util.execute_cmd(calc_cmd.format(
-            level=level, temp=temp_name, scene=scene_name))
-        temp_names.append(temp_name)
-
-    warp_cmd = (
-        'gdalwarp -te {extents} -dstnodata "0" -srcnodata "0"'
-        ' -ot "Byte" -wt "Byte"'
-        ' -co "compress=deflate" -co "zlevel=9"'
-        ' -co "tiled=yes" -co "predictor=2" '
-    ).format(extents=clip_extents)
-    warp_cmd += ' '.join(temp_names)
-    warp_cmd += ' ' + lineage_filename
-    util.execute_cmd(warp_cmd)
-    util.remove(*temp_names)
-
-    logger.info('    End processing for %s as %s ',
-                band_name, lineage_filename)
-    if not os.path.exists(lineage_filename):
-        logger.error('Processing failed to generate desired output: %s',
-                     lineage_filename)
-    return lineage_filename
+        clipped = engine.warp_to_memory([scene_name], temp_name,
+                                        extents=clip_extents,
+                                        dst_nodata='-9999')
+        scene_array = clipped.GetRasterBand(1).ReadAsArray()
+
+        if lineage is None:
+            lineage = np.zeros(scene_array.shape, dtype=np.uint8)
+            template = clipped
+        lineage[(lineage == 0) & (scene_array > -101)] = level
+
+    return lineage_filename, lineage, template
 
 
-def process_lineage_contributing(lineage_filename, n_contrib_scenes):
-    """Check historgram for count of scenes which were not all-fill."""
+def process_lineage_contributing(histogram, n_contrib_scenes):
+    """Check historgram for count of scenes which were not all-fill.
+
+    Args:
+        histogram (numpy.ndarray): pixel count of each lineage level
+        n_contrib_scenes (int): scenes expected to contribute to the tile
+
+    Returns:
+        int: number of scenes which contributed pixels
+        numpy.ndarray: new level for each lineage level, or None to keep
+            the levels unchanged
+
+    """
     logger.info('    Start checking contributing scenes')
 
-    info_cmd = 'gdalinfo -hist {}'
-    results = util.execute_cmd(info_cmd.format(lineage_filename))
-    # TODO: could potentially use this instead...
-    util.remove(lineage_filename + '.aux.xml')
-    count, array = geofuncs.parse_gdal_hist_output(results['output'])
+    array = [long(c) for c in histogram[1:4]]
+    count = sum(c > 0 for c in array)
 
     logger.info('Parsing histogram from lineage file found %d'
                 ' contributing scenes', count)
@@ -297,48 +393,96 @@ def process_lineage_contributing(lineage_filename, n_contrib_scenes):
         raise ArdTileNotNeededException()
 
     # decrement pixel values in lineage file if some scenes didn't contribute
-    # any pixels
-    if count != n_contrib_scenes:
-        delta = n_contrib_scenes - count
-
-        # Determine whether we need decrement the pixel
-        # values in the lineage file or not.
-        cmd = ''
-        if delta == 1:
-            if array[0] == 0:
-                cmd = ' --calc="A-' + str(delta) + '"'
-            elif array[1] == 0 and array[2] > 0:
-                cmd = ' --calc="A-(A==3)"'
-        elif delta == 2:
-            if array[0] == 0 and array[1] == 0:
-                cmd = ' --calc="A-' + str(delta) + '"'
-            elif array[0] == 0 and array[2] == 0:
-                cmd = ' --calc="A-' + str(1) + '"'
-
-        if cmd != '':
-            temp_name = lineage_filename.replace('.tif', '_linTemp.tif')
-            calc_cmd = (
-                'gdal_calc.py -A {lineage} --outfile {temp} {calc}'
-                ' --type="Byte" --NoDataValue=0 --overwrite'
-            )
-            util.execute_cmd(calc_cmd.format(
-                lineage=lineage_filename, temp=temp_name, calc=cmd))
-
-            # compress
-            warp_cmd = (
-                'gdalwarp -co "compress=deflate" -co "zlevel=9"'
-                ' -co "tiled=yes" -co "predictor=2"'
-                ' -overwrite {} {}'
-            )
-            util.execute_cmd(warp_cmd.format(temp_name, lineage_filename))
-            util.remove(temp_name)
+    # any pixels, leaving fill (0) untouched
+    remap = np.arange(256, dtype=np.uint8)
+    delta = n_contrib_scenes - count
+    if delta == 1 and array[0] == 0:
+        remap[1:] -= 1
+    elif delta == 1 and array[1] == 0 and array[2] > 0:
+        remap[3] = 2
+    elif delta == 2 and array[0] == 0 and array[1] == 0:
+        remap[1:] -= 2
+    elif delta == 2 and array[0] == 0 and array[2] == 0:
+        remap[1:] -= 1
+    else:
+        remap = None
 
     logger.info('finish updating contributing scenes')
-    return count
+    return count, remap
+
+
+def write_lineage(lineage_filename, lineage, template, remap, engine):
+    """Write the lineage file once, in its final form.
+
+    Args:
+        lineage_filename (str): path to output GeoTIFF
+        lineage (numpy.ndarray): lineage levels
+        template (gdal.Dataset): source of geolocation, or None if the
+            lineage file was already generated
+        remap (numpy.ndarray): new level for each level, or None
+        engine (warp.WarpEngine): clipping engine
+
+    Returns:
+        str: path to the lineage file
+
+    """
+    if template is None:
+        return lineage_filename
+
+    if remap is not None:
+        lineage = remap[lineage]
+    engine.write_array(lineage, template, lineage_filename, nodata=0,
+                       output_type='Byte')
+
+    logger.info('    End processing for LINEAGEQA as %s ', lineage_filename)
+    if not os.path.exists(lineage_filename):
+        logger.error('Processing failed to generate desired output: %s',
+                     lineage_filename)
+    return lineage_filename
+
+
+def mask_by_lineage(stacking, band_name, clip_extents, mosaic_filename,
+                    lineage, engine, fill, nodata, **clip_opts):
+    """Mosaic scenes, keeping each scene only where LINEAGE selects it.
+
+    Each scene is clipped once into memory, masked where the lineage
+    equals its stacking level, and the combined tile is written directly
+    in its final compressed form.
+
+    Args:
+        stacking (list): contributing scenes, north to south
+        band_name (str): input band name suffix
+        clip_extents (str): tile extents as 'xmin ymin xmax ymax'
+        mosaic_filename (str): path to write output tile band
+        lineage (numpy.ndarray): tile LINEAGEQA levels
+        engine (warp.WarpEngine): clipping engine
+        fill (int): value for pixels not selected by any scene
+        nodata (int): output nodata value, or None to leave unset
+        clip_opts (dict): warp options used to clip each scene
+
+    """
+    mosaic = None
+    for level, stack in enumerate(stacking, start=1):
+        scene_name = geofuncs.find_scene_band(stack['SOURCE'], band_name)
+        temp_name = mosaic_filename.replace('.tif', '_temp%d.tif' % level)
+        clipped = engine.warp_to_memory([scene_name], temp_name,
+                                        extents=clip_extents, **clip_opts)
+        scene_array = clipped.GetRasterBand(1).ReadAsArray()
+        if scene_array.shape != lineage.shape:
+            raise ArdTileException('Clipped %s does not match the lineage'
+                                   % scene_name)
+
+        if mosaic is None:
+            mosaic = np.full_like(scene_array, fill)
+            template = clipped
+        selected = (lineage == level)
+        mosaic[selected] = scene_array[selected]
+
+    engine.write_array(mosaic, template, mosaic_filename, nodata=nodata)
 
 
 def fill_zero_na_lineage(stacking, band_name, clip_extents,
-                         tile_id, rename, workdir):
+                         tile_id, rename, workdir, engine, lineage):
     """Clip scenes which need Lineage to determine NoData fill regions."""
     logger.info('     Start processing for band: %s', band_name)
 
@@ -347,58 +491,21 @@ def fill_zero_na_lineage(stacking, band_name, clip_extents,
 
     if os.path.exists(mosaic_filename):
         logger.warning("Skip previously generated result %s", mosaic_filename)
-        return mosaic_filename
-
-    temp_clipped_names = list()
-    temp_masked_names = list()
-    for level, stack in reversed(list(enumerate(stacking, start=1))):
-        scene_name = util.ffind(workdir, stack['LANDSAT_PRODUCT_ID'],
-                                '*' + band_name + '.tif')
-        lineg_name = util.ffind(workdir, tile_id, '*LINEAGEQA.tif')
-
-        temp_name1 = mosaic_filename.replace('.tif',
-                                             '_temp%d' % level + '.tif')
-        temp_warp_cmd = (
-            'gdalwarp -te {extents} -dstnodata "0"'
-            ' -ot "Byte" -wt "Byte" {0} {1}'
-        )
-        util.execute_cmd(temp_warp_cmd.format(
-            scene_name, temp_name1, extents=clip_extents))
-        temp_clipped_names.append(temp_name1)
-
-        temp_name2 = mosaic_filename.replace('.tif',
-                                             '_temp%dM' % level + '.tif')
-        temp_calc_cmd = (
-            'gdal_calc.py -A {0} -B {lineage} --outfile {1}'
-            ' --calc="A*(B=={level})" '
-            '--type="Byte" --NoDataValue=0'
-        )
-        util.execute_cmd(temp_calc_cmd.format(
-            temp_name1, temp_name2, lineage=lineg_name, level=level))
-        temp_masked_names.append(temp_name2)
-
-    temp_name = mosaic_filename.replace('.tif', '_temp.tif')
-    temp_warp_cmd = 'gdalwarp {} {}'.format(' '.join(temp_masked_names),
-                                            temp_name)
-    util.execute_cmd(temp_warp_cmd)
-    util.remove(*temp_masked_names + temp_clipped_names)
-
-    warp_cmd = (
-        'gdalwarp -dstnodata "None" -srcnodata "256" -co "compress=deflate"'
-        ' -co "zlevel=9" -co "tiled=yes" -co "predictor=2" {} {}'
-    )
-    util.execute_cmd(warp_cmd.format(temp_name, mosaic_filename))
-    util.remove(temp_name)
+        return mosaic_filename, None
+
+    mask_by_lineage(stacking, band_name, clip_extents, mosaic_filename,
+                    lineage, engine, fill=0, nodata=None,
+                    dst_nodata='0', output_type='Byte', working_type='Byte')
 
     logger.info('    End processing for %s as %s ', band_name, mosaic_filename)
     if not os.path.exists(mosaic_filename):
         logger.error('Processing failed to generate desired output: %s',
                      mosaic_filename)
-    return mosaic_filename
+    return mosaic_filename, None
 
 
 def calc_nodata_9999_uint_lineage(stacking, band_name, clip_extents,
-                                  tile_id, rename, workdir):
+                                  tile_id, rename, workdir, engine, lineage):
     """Clip scenes which do not have NoData, apply -9999 where no LINEAGE."""
     logger.info('     Start processing for band: %s', band_name)
 
@@ -407,58 +514,22 @@ def calc_nodata_9999_uint_lineage(stacking, band_name, clip_extents,
 
     if os.path.exists(mosaic_filename):
         logger.warning("Skip previously generated result %s", mosaic_filename)
-        return mosaic_filename
-
-    temp_clipped_names = list()
-    temp_masked_names = list()
-    for level, stack in reversed(list(enumerate(stacking, start=1))):
-        scene_name = util.ffind(workdir, stack['LANDSAT_PRODUCT_ID'],
-                                '*' + band_name + '.tif')
-
-        temp_name1 = mosaic_filename.replace('.tif',
-                                             '_temp%d' % level + '.tif')
-        temp_warp_cmd = (
-            'gdalwarp -te {extents} -ot "Int16"'
-            ' -dstnodata "-9999" -srcnodata "None"  {0} {1}'
-        )
-        util.execute_cmd(temp_warp_cmd.format(
-            scene_name, temp_name1, extents=clip_extents))
-        temp_clipped_names.append(temp_name1)
-
-        lineg_name = util.ffind(workdir, tile_id, '*LINEAGEQA.tif')
-        temp_name2 = mosaic_filename.replace('.tif',
-                                             '_temp%dM' % level + '.tif')
-        temp_calc_cmd = (
-            'gdal_calc.py -A {0} -B {lineage} --outfile {1}'
-            ' --calc="(A*(B=={level}) + (-9999*(B!={level})))"'
-            ' --NoDataValue=-9999'
-        )
-        util.execute_cmd(temp_calc_cmd.format(
-            temp_name1, temp_name2, lineage=lineg_name, level=level))
-        temp_masked_names.append(temp_name2)
-
-    temp_name = mosaic_filename.replace('.tif', '_temp.tif')
-    temp_warp_cmd = 'gdalwarp {} {}'.format(' '.join(temp_masked_names),
-                                            temp_name)
-    util.execute_cmd(temp_warp_cmd)
-    util.remove(*temp_masked_names + temp_clipped_names)
-
-    warp_cmd = (
-        'gdalwarp -dstnodata "-9999" -srcnodata "-9999" -co "compress=deflate"'
-        ' -co "zlevel=9" -co "tiled=yes" -co "predictor=2" {} {}'
-    )
-    util.execute_cmd(warp_cmd.format(temp_name, mosaic_filename))
-    util.remove(temp_name)
+        return mosaic_filename, None
+
+    mask_by_lineage(stacking, band_name, clip_extents, mosaic_filename,
+                    lineage, engine, fill=-9999, nodata=-9999,
+                    dst_nodata='-9999', src_nodata='None',
+                    output_type='Int16')
 
     logger.info('    End processing for %s as %s ', band_name, mosaic_filename)
     if not os.path.exists(mosaic_filename):
         logger.error('Processing failed to generate desired output: %s',
                      mosaic_filename)
-    return mosaic_filename
+    return mosaic_filename, None
 
 
 def calc_nodata_9999_lineage(stacking, band_name, clip_extents,
-                             tile_id, rename, workdir):
+                             tile_id, rename, workdir, engine, lineage):
     """Clip scenes which have data outside the lineage, apply -9999 fill."""
     logger.info('     Start processing for band: %s', band_name)
 
@@ -467,64 +538,28 @@ def calc_nodata_9999_lineage(stacking, band_name, clip_extents,
 
     if os.path.exists(mosaic_filename):
         logger.warning("Skip previously generated result %s", mosaic_filename)
-        return mosaic_filename
-
-    temp_clipped_names = list()
-    temp_masked_names = list()
-    for level, stack in reversed(list(enumerate(stacking, start=1))):
-        scene_name = util.ffind(workdir, stack['LANDSAT_PRODUCT_ID'],
-                                '*' + band_name + '.tif')
-
-        temp_name1 = mosaic_filename.replace('.tif',
-                                             '_temp%d' % level + '.tif')
-        temp_warp_cmd = (
-            'gdalwarp -te {extents}'
-            ' -dstnodata "-9999" -srcnodata "-9999" {0} {1}'
-        )
-        util.execute_cmd(temp_warp_cmd.format(
-            scene_name, temp_name1, extents=clip_extents))
-        temp_clipped_names.append(temp_name1)
-
-        lineg_name = util.ffind(workdir, tile_id, '*LINEAGEQA.tif')
-        temp_name2 = mosaic_filename.replace('.tif',
-                                             '_temp%dM' % level + '.tif')
-        temp_calc_cmd = (
-            'gdal_calc.py -A {0} -B {lineage} --outfile {1}'
-            ' --calc="(A*(B=={level}) + (-9999*(B!={level})))"'
-            ' --NoDataValue=-9999'
-        )
-        util.execute_cmd(temp_calc_cmd.format(
-            temp_name1, temp_name2, lineage=lineg_name, level=level))
-        temp_masked_names.append(temp_name2)
-
-    temp_name = mosaic_filename.replace('.tif', '_temp.tif')
-    temp_warp_cmd = 'gdalwarp {} {}'.format(' '.join(temp_masked_names),
-                                            temp_name)
-    util.execute_cmd(temp_warp_cmd)
-    util.remove(*temp_masked_names + temp_clipped_names)
-
-    warp_cmd = (
-        'gdalwarp -dstnodata "-9999" -srcnodata "-9999" -co "compress=deflate"'
-        ' -co "zlevel=9" -co "tiled=yes" -co "predictor=2" {} {}'
-    )
-    util.execute_cmd(warp_cmd.format(temp_name, mosaic_filename))
-    util.remove(temp_name)
+        return mosaic_filename, None
+
+    mask_by_lineage(stacking, band_name, clip_extents, mosaic_filename,
+                    lineage, engine, fill=-9999, nodata=-9999,
+                    dst_nodata='-9999', src_nodata='-9999')
 
     logger.info('    End processing for %s as %s ', band_name, mosaic_filename)
     if not os.path.exists(mosaic_filename):
         logger.error('Processing failed to generate desired output: %s',
                      mosaic_filename)
-    return mosaic_filename
+    return mosaic_filename, None
 
 
 def process_metadata(segment, stacking, tile_id, clip_extents, region,
                      lng_count, production_timestamp, producers,
-                     workdir):
+                     workdir, pqa_histogram=None):
     """Create the tile metadata file, Generate statistics we will need."""
     logger.info('     Start processing for metadata')
 
     pqa_name = util.ffind(workdir, tile_id, '*PIXELQA.tif')
-    bit_counts = geofuncs.raster_value_count(pqa_name, tile_id)
+    bit_counts = geofuncs.raster_value_count(pqa_name, tile_id,
+                                             histogram=pqa_histogram)
 
     metadata_locs = list()
     for stack in stacking:
@@ -572,35 +607,72 @@ def process_metadata(segment, stacking, tile_id, clip_extents, region,
     return filenames
 
 
-def process_output(products, producers, outputs, workdir, tile_id,
-                   output_path):
-    """Combine the Landsat mosaics into the .tar files."""
+def package_product(product_request, producers, outputs, tile_id,
+                    output_path):
+    """Write one product tarball to the output directory and verify it.
+
+    Returns:
+        bool: whether the stored tarball matches the digest written
+
+    """
+    archive = tile_id + '_' + product_request + '.tar'
+    logging.info('Create product %s', archive)
+    required = producers['package'][product_request]
+    included = [o for o in outputs.values()
+                if isinstance(o, str) and any([r in o for r in required])]
+    included.append(outputs['XML'][product_request])
+
+    output_archive = os.path.join(output_path, archive)
+
+    # Write the tarball straight to the output directory, digesting it
+    # as it is written, then verify the stored copy against that.
+    md5hash = util.tar_archive_md5(output_archive, included)
+    if util.checksum_md5(output_archive) != md5hash:
+        logger.error('%s checksums do not match.', archive)
+        return False
+    logger.info('%s checksums match.', archive)
+    util.write_md5_file(output_archive, md5hash)
+    return True
+
+
+def process_output(products, producers, outputs, tile_id, output_path,
+                   workers=1):
+    """Combine the Landsat mosaics into the .tar files.
+
+    Each product is packaged, transferred and verified independently, so
+    up to `workers` products are written to the output storage at once.
+
+    """
     status = 0    # Initialize the return status.
 
     util.make_dirs(output_path)
 
-    for product_request in sorted(products, reverse=True):
-        archive = tile_id + '_' + product_request + '.tar'
-        logging.info('Create product %s', archive)
-        required = producers['package'][product_request]
-        included = [o for o in outputs.values()
-                    if any([r in o for r in required]) and isinstance(o, str)]
-        included.append(outputs['XML'][product_request])
-
-        local_archive = os.path.join(workdir, archive)
-        output_archive = os.path.join(output_path, archive)
-        output_xml = os.path.join(output_path, os.path.basename
-                                  (outputs['XML'][product_request]))
-        util.tar_archive(local_archive, included)
-
-        # Copy tarball to output directory.
-        shutil.copyfile(local_archive, output_archive)
-        shutil.copyfile(outputs['XML'][product_request], output_xml)
-
-    # Create checksums for the output tarballs, and compare with the files
-    # in the working directory.
-    if util.process_checksums(tile_id+'*.tar', workdir, output_path) == 'ERROR':
-        logger.error('Checksum processing failed.')
+    def package(product_request):
+        return product_request, package_product(product_request, producers,
+                                                 outputs, tile_id,
+                                                 output_path)
+
+    product_requests = sorted(products, reverse=True)
+
+    # Products of one metadata group share its XML, so copy each XML once
+    for xml_filename in set(outputs['XML'][p] for p in product_requests):
+        shutil.copyfile(xml_filename, os.path.join(
+            output_path, os.path.basename(xml_filename)))
+
+    n_workers = max(1, min(workers, len(product_requests)))
+    if n_workers > 1:
+        pool = ThreadPool(n_workers)
+        try:
+            results = pool.map(package, product_requests, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(package, product_requests)
+
+    failed = [product for product, success in results if not success]
+    if failed:
+        logger.error('Checksum processing failed: %s', ', '.join(failed))
 
         # Clean up output files upon failure.
         for fullname in glob.glob(os.path.join(output_path, tile_id+'*')):
@@ -608,10 +680,6 @@ def process_output(products, producers, outputs, workdir, tile_id,
 
         status = 1
 
-    # Remove local copies of product files.
-    for fullname in glob.glob(os.path.join(workdir, tile_id+'*.tar')):
-        os.remove(fullname)
-
     if status == 0:
         logger.info('    End product transfer')
     else:
@@ -632,65 +700,23 @@ def process_browse(bands, workdir, tile_id, outpath):
 
     bands = {k: util.ffind(workdir, tile_id, tile_id + '_' + v + '.tif')
              for k, v in bands.items()}
-
-    # create RGB image
-    temp_filename1 =  os.path.join(workdir, tile_id + '_brw1.tif')
-    merge_cmd = 'gdal_merge.py -o {outfile} -separate {red} {green} {blue}'
-    results = util.execute_cmd(merge_cmd.format(outfile=temp_filename1,
-                                                **bands))
-    if results['status'] != 0:
-        return results['status']
-
-    # scale the pixel values
-    temp_filename2 = os.path.join(workdir, tile_id + '_brw2.tif')
-    scale_cmd = 'gdal_translate -scale 0 10000 -ot Byte {} {}'
-    results = util.execute_cmd(scale_cmd.format(temp_filename1,
-                                                temp_filename2))
-    if results['status'] != 0:
-        return results['status']
-
-    # apply compression
-    browse_filename = os.path.join(workdir, tile_id + '.tif')
-    comp_cmd = 'gdal_translate -co COMPRESS=JPEG -co PHOTOMETRIC=YCBCR {} {}'
-    results = util.execute_cmd(comp_cmd.format(temp_filename2,
-                                               browse_filename))
-    if results['status'] != 0:
-        # The browse generation failed on the HSM.
-        # Wait a short period and try again.
-        logger.warning('gdal_translate failed to create the browse.  '
-                       'Trying again.')
-        time.sleep(10)
-        results = util.execute_cmd(comp_cmd.format(temp_filename2,
-                                                   browse_filename))
-        if results['status'] != 0:
-            return results['status']
-
-    # internal pyramids
-    addo_cmd = 'gdaladdo {} 2 4 8 16'
-    results = util.execute_cmd(addo_cmd.format(browse_filename))
-    if results['status'] != 0:
-        # The pyramid generation failed on the HSM.
-        # Wait a short period and try again.
-        logger.warning('gdaladdo failed to create the pyramids.  '
-                       'Trying again.')
-        time.sleep(10)
-        results = util.execute_cmd(addo_cmd.format(browse_filename))
-        if results['status'] != 0:
-            return results['status']
-
-    # Copy the browse to the output location, and verify using checksums.
-    shutil.copyfile(browse_filename, output_browse_filename)
-    if (util.checksum_md5(browse_filename) !=
-        util.checksum_md5(output_browse_filename)):
-        logger.warning('%s checksums do not match.',
-                       os.path.basename(browse_filename))
-        os.remove(output_browse_filename)
+    if None in bands.values():
+        logger.error('Missing browse bands for %s', tile_id)
         return 1
-    else:
-        logger.info('%s checksums match.', os.path.basename(browse_filename))
 
-    util.remove(temp_filename1, temp_filename2, browse_filename + '.aux.xml',
-                browse_filename)
+    # Scale, compress and add pyramids in one pass, writing to a
+    # temporary name in the output location until complete.
+    partial_filename = output_browse_filename + '.partial'
+    try:
+        geofuncs.write_browse([bands['red'], bands['green'], bands['blue']],
+                              partial_filename)
+        os.rename(partial_filename, output_browse_filename)
+    except (IOError, RuntimeError):
+        logger.exception('Failed to create the browse')
+        return 1
+    finally:
+        util.remove(partial_filename, partial_filename + '.aux.xml')
+    util.make_file_group_writeable(output_browse_filename)
 
     logger.info('    End building browse.')
     return 0
@@ -714,12 +740,148 @@ class ArdSceneException(Exception):
     pass
 
 
-def process_segment(segment, output_path, conf):
+def clip_tile(current_tile, tile_id, segment, region, tile_scenes,
+              scene_files, patterns, output_path, conf, engine,
+              band_pool=None):
+    """Create one tile, returning 1 if an error calls for a scene retry."""
+    tiling_error_encountered = 0
+    try:
+        tile_state = process_tile(current_tile, tile_id, segment, region,
+                                  tile_scenes, scene_files, patterns,
+                                  output_path, conf, engine, band_pool)
+        if tile_state == 'ERROR':
+            tiling_error_encountered = 1
+    except ArdTileNotNeededException:
+        logger.warning('Lineage file found 0 contributing scenes,'
+                       ' set to NOT NEEDED')
+    except ArdTileException:
+        logger.exception('Error caught while processing tile %s!',
+                         current_tile)
+    except ArdSceneException:
+        logger.exception('Error caught while processing scene %s!',
+                         segment['LANDSAT_PRODUCT_ID'])
+        tiling_error_encountered = 1
+    except Exception:
+        logger.exception('Unexpected error processing tile %s!',
+                         current_tile)
+        tiling_error_encountered = 1
+
+    # Remove the temporary work directory,
+    # but keep adjacent scenes for other tiles
+    if not conf.debug:
+        logger.info('    Cleanup: Removing temp directory: %s ...',
+                    os.path.join(conf.workdir, tile_id))
+        util.remove(os.path.join(conf.workdir, tile_id))
+    return tiling_error_encountered
+
+
+def band_worker_count(conf):
+    """Number of band threads per tile, sharing the CPUs with tile workers."""
+    n_workers = conf.band_workers
+    if conf.get('cpus'):
+        n_workers = min(n_workers, conf.cpus // max(1, conf.tile_workers))
+    return max(1, n_workers)
+
+
+def make_band_pool(conf):
+    """Create the band threads reused by every tile, or None if only one."""
+    n_workers = band_worker_count(conf)
+    if n_workers < 2:
+        return None
+    logger.info('Processing bands with %d threads', n_workers)
+    return ThreadPool(n_workers)
+
+
+def close_band_pool(band_pool):
+    """Stop the band threads, if any."""
+    if band_pool is not None:
+        band_pool.close()
+        band_pool.join()
+
+
+def tile_worker_count(conf, n_tiles):
+    """Number of tile workers allowed by the config and Mesos CPU share."""
+    n_workers = conf.tile_workers
+    if conf.get('cpus'):
+        n_workers = min(n_workers, conf.cpus)
+    return max(1, min(n_workers, n_tiles))
+
+
+# Clipping engine and band threads owned by each tile worker process
+worker_engine = None
+worker_band_pool = None
+
+
+def init_tile_worker(conf):
+    """Give a tile worker process its own clipping engine and threads."""
+    global worker_engine, worker_band_pool
+    worker_engine = make_warp_engine(conf)
+    worker_band_pool = make_band_pool(conf)
+
+
+def clip_tile_worker(args):
+    """Pool entrypoint for clip_tile, using the worker's engine."""
+    return clip_tile(*args, engine=worker_engine,
+                     band_pool=worker_band_pool)
+
+
+def make_warp_engine(conf):
+    """Create the clipping engine shared by all tiles of a segment."""
+    overviews = ()
+    if conf.output_format == 'cog':
+        overviews = conf.overview_levels
+    profile = warp.OutputProfile(compress=conf.compress,
+                                 level=conf.compress_level,
+                                 predictor=conf.predictor,
+                                 blocksize=conf.blocksize,
+                                 overviews=overviews,
+                                 resampling=conf.overview_resampling)
+    return warp.WarpEngine(conf.warp_engine, profile=profile)
+
+
+def resolve_scene_files(segment, tile_scenes, conf, path_file_locs):
+    """Find the files of all scenes contributing to a segment's tiles.
+
+    Inventory records are fetched once per path and day for the whole job,
+    rather than searched by product id once per tile and scene.
+
+    Args:
+        segment (dict): information about a scene
+        tile_scenes (dict): neighboring scene details, by tile
+        conf (dict): runtime configuration options
+        path_file_locs (dict): inventory records already fetched for the
+            segment, by satellite, path and date, updated in place
+
+    Returns:
+        dict: {product id: file path} of each scene, by scene wildcard
+
+    """
+    scene_files = dict()
+    for records in tile_scenes.values():
+        for record in records:
+            wildcard = '{wrspath}{wrsrow}_{acqdate}'.format(**record)
+            if wildcard in scene_files:
+                continue
+            key = (segment['SATELLITE'], record['wrspath'], record['acqdate'])
+            if key not in path_file_locs:
+                path_file_locs[key] = db.fetch_path_file_locs(
+                    db.connect(conf.connstr), sat=segment['SATELLITE'],
+                    wrspath=record['wrspath'], acqdate=record['acqdate'])
+            scene_files[wildcard] = {
+                r['LANDSAT_PRODUCT_ID']: util.ffind(r['FILE_LOC'])
+                for r in path_file_locs[key]
+                if wildcard in r['LANDSAT_PRODUCT_ID']
+            }
+    return scene_files
+
+
+def process_segment(segment, output_path, conf, states, path_file_locs):
     """Produce all necessary products for a segment of acquisitions."""
     scene_state = "INWORK"
-    # update PROCESSING_STATE in ARD_PROCESSED_SCENES to 'INWORK'
-    db.update_scene_state(db.connect(conf.connstr),
-                          segment['LANDSAT_PRODUCT_ID'], scene_state)
+    # update PROCESSING_STATE in ARD_PROCESSED_SCENES to 'INWORK', in the
+    # same commit as the final state of the previous scene
+    states.set_state(segment['LANDSAT_PRODUCT_ID'], scene_state)
+    states.flush()
 
     logger.info("Scene %s is %s.", segment['LANDSAT_PRODUCT_ID'], scene_state)
     id_parts = landsat.match_dt(segment['LANDSAT_PRODUCT_ID'])
@@ -729,8 +891,7 @@ def process_segment(segment, output_path, conf):
         region = pathrow2regionLU[pathrow]
     else:
         scene_state = "NOGRID"
-        db.update_scene_state(db.connect(conf.connstr),
-                              segment['LANDSAT_PRODUCT_ID'], scene_state)
+        states.set_state(segment['LANDSAT_PRODUCT_ID'], scene_state)
         return scene_state
 
     # Intersect scene with tile grid to find all touching tiles, and
@@ -748,41 +909,63 @@ def process_segment(segment, output_path, conf):
 
         scene_state = "ERROR"
         # update PROCESSING_STATE in ARD_PROCESSED_SCENES
-        db.update_scene_state(db.connect(conf.connstr),
-                              segment['LANDSAT_PRODUCT_ID'], scene_state)
+        states.set_state(segment['LANDSAT_PRODUCT_ID'], scene_state)
         return scene_state
 
-    tiling_error_encountered = 0
+    # A tile whose id cannot be made fails alone, like any other tile error
+    tile_errors = []
+    tile_ids = []
     for current_tile in hv_tiles:
         try:
-            tile_id = landsat.generate_tile_id(segment['LANDSAT_PRODUCT_ID'],
-                                               current_tile, region,
-                                               conf.collection, conf.version)
-            tile_state = process_tile(current_tile, tile_id, segment, region,
-                                      tile_scenes, output_path, conf)
-            if tile_state == 'ERROR':
-                tiling_error_encountered = 1
-        except ArdTileNotNeededException:
-            logger.warning('Lineage file found 0 contributing scenes,'
-                           ' set to NOT NEEDED')
-        except ArdTileException:
-            logger.exception('Error caught while processing tile %s!',
-                             current_tile)
-        except ArdSceneException:
-            logger.exception('Error caught while processing scene %s!',
-                             segment['LANDSAT_PRODUCT_ID'])
-            tiling_error_encountered = 1
+            tile_ids.append((current_tile, landsat.generate_tile_id(
+                segment['LANDSAT_PRODUCT_ID'], current_tile, region,
+                conf.collection, conf.version)))
         except Exception:
             logger.exception('Unexpected error processing tile %s!',
                              current_tile)
-            tiling_error_encountered = 1
-
-        # Remove the temporary work directory,
-        # but keep adjacent scenes for other tiles
-        if not conf.debug:
-            logger.info('    Cleanup: Removing temp directory: %s ...',
-                        os.path.join(conf.workdir, tile_id))
-            util.remove(os.path.join(conf.workdir, tile_id))
+            tile_errors.append(1)
+
+    # Skip tiles already in ARD_COMPLETED_TILES before staging any scenes
+    completed = db.completed_tiles(db.connect(conf.connstr),
+                                   [tile_id for _, tile_id in tile_ids])
+    for tile_id in sorted(completed):
+        logger.warning('Tile already created! %s', tile_id)
+    todo = [(current_tile, tile_id) for current_tile, tile_id in tile_ids
+            if tile_id not in completed]
+
+    scene_files = resolve_scene_files(segment, tile_scenes, conf,
+                                      path_file_locs)
+    producers = config.read_processing_config(sensor=segment['SATELLITE'])
+    patterns = scene_member_patterns(producers, conf)
+    tile_args = [(current_tile, tile_id, segment, region, tile_scenes,
+                  scene_files, patterns, output_path, conf)
+                 for current_tile, tile_id in todo]
+    n_workers = tile_worker_count(conf, len(tile_args))
+    if n_workers > 1:
+        logger.info('Clipping %d tiles with %d workers',
+                    len(tile_args), n_workers)
+        pool = multiprocessing.Pool(n_workers, initializer=init_tile_worker,
+                                    initargs=(conf,))
+        try:
+            tile_errors += pool.map(clip_tile_worker, tile_args,
+                                    chunksize=1)
+            pool.close()
+        except BaseException:
+            # Do not wait for the remaining tiles, e.g. on SIGTERM
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        engine = make_warp_engine(conf)
+        band_pool = make_band_pool(conf)
+        try:
+            tile_errors += [clip_tile(*args, engine=engine,
+                                      band_pool=band_pool)
+                            for args in tile_args]
+        finally:
+            close_band_pool(band_pool)
+    tiling_error_encountered = int(any(tile_errors))
 
     # If no tiling errors were encountered that may call for a retry,
     # we're done with this scene.  Otherwise, mark the scene for a
@@ -793,29 +976,91 @@ def process_segment(segment, output_path, conf):
         scene_state = "ERROR"
 
     # update PROCESSING_STATE in ARD_PROCESSED_SCENES
-    db.update_scene_state(db.connect(conf.connstr),
-                          segment['LANDSAT_PRODUCT_ID'], scene_state)
+    states.set_state(segment['LANDSAT_PRODUCT_ID'], scene_state)
 
     return scene_state
 
 
+def prefetch_scene(segment, conf):
+    """Stage and unpack a segment scene before its tiles are clipped.
+
+    The scene is skipped if unpacking it could leave less than
+    prefetch_reserve_mb free in the work directory; its tiles then unpack
+    it themselves once the earlier scenes have been cleaned up.
+
+    """
+    product_id = segment['LANDSAT_PRODUCT_ID']
+    directory = os.path.join(conf.workdir, product_id)
+    if os.path.isdir(directory):
+        return
+
+    tar_file_location = util.ffind(segment['FILE_LOC'])
+    if tar_file_location is None:
+        logger.warning('Prefetch could not find %s', segment['FILE_LOC'])
+        return
+    # Budget for the unpacked bands being larger than the bundle
+    needed_mb = 3 * os.path.getsize(tar_file_location) // (1024 * 1024)
+    free_mb = util.disk_free_mb(conf.workdir)
+    if free_mb - needed_mb < conf.prefetch_reserve_mb:
+        logger.info('Skip prefetch of %s, %d MB free', product_id, free_mb)
+        return
+
+    logger.info('Prefetch scene: %s', tar_file_location)
+    if conf.hsmstage:
+        external.stage_files([tar_file_location], conf.soap_envelope)
+    producers = config.read_processing_config(sensor=segment['SATELLITE'])
+    unpack_scene(product_id, tar_file_location,
+                 scene_member_patterns(producers, conf), conf)
+
+
+def prefetch_scene_worker(segment, conf):
+    """Run a prefetch in a child process, logging rather than raising."""
+    try:
+        prefetch_scene(segment, conf)
+    except Exception:
+        logger.exception('Prefetch of %s failed',
+                         segment['LANDSAT_PRODUCT_ID'])
+
+
 def process_segments(segments, output_path, conf):
     """Clips tiles from a list of contiguous scenes aka segment."""
+    states = db.SceneStateWriter(conf.connstr)
+    states.flush_on_exit(signal.SIGTERM)
+    prefetcher = None
+    # Inventory records fetched for the segment, by satellite, path and date
+    path_file_locs = dict()
     for i, segment in enumerate(segments):
         # Cleanup unneeded scene directories to save space
         # Results of this check should keep no more than 3 scenes
-        # in work directory at a time
+        # in work directory at a time, or 4 while the next but one
+        # scene is prefetched
         if (i - 2) > -1:
-            previous_scene = segments[i - 2]['LANDSAT_PRODUCT_ID']
-            util.remove(previous_scene)
-
-        scene_state = process_segment(segment, output_path, conf)
+            remove_scene(segments[i - 2]['LANDSAT_PRODUCT_ID'])
+
+        # Tiles of the next scene also overlap the scene after it, so
+        # unpack that one while this scene is being clipped.  A process
+        # rather than a thread keeps the tile pool from forking mid-unpack.
+        if prefetcher is not None:
+            prefetcher.join()
+            prefetcher = None
+        if conf.prefetch and (i + 2) < len(segments):
+            prefetcher = multiprocessing.Process(
+                target=prefetch_scene_worker, args=(segments[i + 2], conf))
+            prefetcher.start()
+
+        scene_state = process_segment(segment, output_path, conf, states,
+                                      path_file_locs)
         logger.info("Scene %s is %s.",
                     segment['LANDSAT_PRODUCT_ID'], scene_state)
         logger.info('Segment loop: %d', i)
 
+    if prefetcher is not None:
+        prefetcher.join()
+
+    # Record the final state of the last scene
+    states.flush()
+
     # cleanup any remaining scene directories
     for segment in segments:
-        previous_scene = segment['LANDSAT_PRODUCT_ID']
         if not conf.debug:
-            util.remove(previous_scene)
+            remove_scene(segment['LANDSAT_PRODUCT_ID'])
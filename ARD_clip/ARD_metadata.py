@@ -539,23 +539,19 @@ def fixTileBand2(tileID, filenames, productionDateTime, bandTag):
 
 def getGeographicBoundingCoordinates(horiz, vertical, region):
     """Create a string containing the WGS84 geographic coordinates."""
-    datasource = geofuncs.read_shapefile(region=region)
-    layer = datasource.GetLayer()
-    query = 'H=' + str(int(horiz)) + ' and V=' + str(int(vertical))
-    layer.SetAttributeFilter(query)
-    for feature in layer:
-        latN = feature.GetField("LAT_NORTH")
-        latS = feature.GetField("LAT_SOUTH")
-        lonW = feature.GetField("LON_WEST")
-        lonE = feature.GetField("LON_EAST")
-        newBoundingCoords = (
-            '<bounding_coordinates><west>' + str(lonW) + '</west><east>' +
-            str(lonE) + '</east><north>' + str(latN) + '</north><south>' +
-            str(latS) + '</south></bounding_coordinates>'
-        )
-        logger.debug('      > meta: %s', newBoundingCoords)
-
-        return newBoundingCoords
+    bounds = geofuncs.tile_grid(region).bounds.get((int(horiz), int(vertical)))
+    if bounds is None:
+        return None
+
+    newBoundingCoords = (
+        '<bounding_coordinates><west>' + str(bounds['LON_WEST']) +
+        '</west><east>' + str(bounds['LON_EAST']) + '</east><north>' +
+        str(bounds['LAT_NORTH']) + '</north><south>' +
+        str(bounds['LAT_SOUTH']) + '</south></bounding_coordinates>'
+    )
+    logger.debug('      > meta: %s', newBoundingCoords)
+
+    return newBoundingCoords
 
 
 def global_createProjInfo(cutLimits, region):
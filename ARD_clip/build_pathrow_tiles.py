@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+"""Precompute the ARD tiles which each WRS-2 path/row may intersect.
+
+Writes a <region>_pathrow_tiles.json table for each region, mapping every
+path/row of the region to its candidate tiles, and each of those tiles to
+the rows along the same path which may also cover it.  Scene footprints
+shift slightly between acquisitions, so the tiles intersecting each
+nominal WRS-2 scene polygon are widened by a ring of neighbouring grid
+tiles.  A footprint strays from its nominal polygon by a few kilometres,
+far less than a tile (5000 pixels, 150 km), so the candidates remain a
+superset of the exact intersections, which are still tested when
+clipping.  The ring is counted in H/V steps on the grid itself, so unlike
+a margin in degrees it does not narrow towards the poles or wrap at the
+antimeridian.
+"""
+import os
+import json
+from argparse import ArgumentParser
+
+from osgeo import ogr
+
+import geofuncs
+from util import setup_logger, logger
+from ARD_regionLU import pathrow2regionLU
+
+
+def parse_cli():
+    """Parse supplied command line arguments."""
+    parser = ArgumentParser()
+    parser.add_argument(action="store", dest='wrs_shapefile',
+                        type=str, metavar='SHP',
+                        help='WRS-2 descending scene polygons')
+    parser.add_argument('-o', '--output-dir', action="store",
+                        dest='output_dir', default=os.getenv('ARD_AUX_DIR'),
+                        required=False, type=str, metavar='PATH')
+    parser.add_argument('-r', '--region', action="append", dest='regions',
+                        default=None, required=False, type=str,
+                        metavar='REGION', help='default: all regions')
+    parser.add_argument('-n', '--neighbors', action="store", dest='n',
+                        default=2, required=False, type=int,
+                        help='rows either side which may share a tile')
+    parser.add_argument('--ring', action="store", dest='ring',
+                        default=1, required=False, type=int,
+                        help='neighbouring tiles added around each scene')
+    return vars(parser.parse_args())
+
+
+def read_wrs_polygons(wrs_shapefile):
+    """Read nominal WRS-2 scene polygons keyed by path/row."""
+    datasource = ogr.Open(wrs_shapefile)
+    if datasource is None:
+        raise IOError('Could not open {0}'.format(wrs_shapefile))
+
+    polygons = dict()
+    for feature in datasource.GetLayer():
+        pathrow = '{0:03d}{1:03d}'.format(int(feature.GetField('PATH')),
+                                          int(feature.GetField('ROW')))
+        polygons[pathrow] = feature.GetGeometryRef().Clone()
+    return polygons
+
+
+def candidate_tiles(grid, polygon, ring=1):
+    """Keys of the tiles within ring tiles of those a polygon intersects.
+
+    Args:
+        grid (geofuncs.TileGrid): tile grid of the region
+        polygon (ogr.Geometry): nominal scene polygon
+        ring (int): neighbouring tiles added on each side
+
+    Returns:
+        set: tile keys (e.g. 'H011V003')
+
+    """
+    keys = set()
+    for index in grid.intersecting(polygon):
+        tile = grid.tiles[index]
+        for h in range(tile['H'] - ring, tile['H'] + ring + 1):
+            for v in range(tile['V'] - ring, tile['V'] + ring + 1):
+                key = 'H{0:03d}V{1:03d}'.format(h, v)
+                if key in grid.index:
+                    keys.add(key)
+    return keys
+
+
+def build_region_table(region, polygons, n=2, ring=1):
+    """Map each path/row of a region to its candidate tiles.
+
+    Args:
+        region (str): ARD grid tile area (e.g. CU, AK, HI)
+        polygons (dict): nominal scene polygons keyed by path/row
+        n (int): rows either side which may share a tile
+        ring (int): neighbouring tiles added around each scene
+
+    Returns:
+        dict: {pathrow: {tile key: [rows which may cover the tile]}}
+
+    """
+    grid = geofuncs.tile_grid(region)
+
+    # Neighbouring rows may belong to another region, but still cover
+    # tiles of this one
+    nearby = dict()
+
+    def nearby_tiles(pathrow):
+        """Candidate tiles of a path/row, found only once."""
+        if pathrow not in nearby:
+            nearby[pathrow] = set()
+            if pathrow in polygons:
+                nearby[pathrow] = candidate_tiles(grid, polygons[pathrow],
+                                                  ring)
+        return nearby[pathrow]
+
+    table = dict()
+    for pathrow, pathrow_region in sorted(pathrow2regionLU.items()):
+        if pathrow_region != region or pathrow not in polygons:
+            continue
+        path, row = pathrow[:3], int(pathrow[3:])
+        rows = range(row - n, row + n + 1)
+        table[pathrow] = {
+            key: [r for r in rows
+                  if key in nearby_tiles('{0}{1:03d}'.format(path, r))]
+            for key in sorted(nearby_tiles(pathrow))
+        }
+    return table
+
+
+if __name__ == '__main__':
+    args = parse_cli()
+    setup_logger(level='info')
+
+    polygons = read_wrs_polygons(args['wrs_shapefile'])
+    regions = args['regions'] or sorted(set(pathrow2regionLU.values()))
+    for region in regions:
+        table = build_region_table(region, polygons, n=args['n'],
+                                   ring=args['ring'])
+        filename = os.path.join(args['output_dir'],
+                                geofuncs.PATHROW_TABLE.format(region=region))
+        with open(filename, 'w') as fid:
+            json.dump(table, fid, sort_keys=True, separators=(',', ':'))
+        logger.info('Wrote %d %s path/rows to %s', len(table), region,
+                    filename)
@@ -18,18 +18,24 @@ def parse_cli():
     parser.add_argument('-c', '--config', action="store", dest='config_file',
                         default='/ARD_Clip.conf',
                         required=False, type=str, metavar='PATH')
+    parser.add_argument('--cpus', action="store", dest='cpus',
+                        default=1, required=False, type=int,
+                        metavar='N',
+                        help='CPUs allocated to this task (default: 1)')
     return vars(parser.parse_args())
 
 
 if __name__ == '__main__':
     args = parse_cli()
     conf = config.read_config(args['config_file'])
+    conf.cpus = args['cpus']
     setup_logger(level='debug' if conf.debug else 'info')
 
     logger.info('******************Start************')
     logger.info('             DB connection: %s', conf.connstr)
     logger.info("             Version: %s", conf.version)
     logger.info("             Debug: %s", conf.debug)
+    logger.info("             CPUs: %s", conf.cpus)
     logger.info('segment: %s', args['segment'])
     logger.info('output path: %s', args['output_path'])
 
@@ -64,6 +64,75 @@ def read_config(config_file=None):
         options.minscenespertile = config.getint(section, 'minscenespertile')
     if config.has_option(section, 'maxscenespertile'):
         options.maxscenespertile = config.getint(section, 'maxscenespertile')
+    if config.has_option(section, 'warp_engine'):
+        options.warp_engine = config.get(section, 'warp_engine')
+    else:
+        options.warp_engine = 'subprocess'
+    if config.has_option(section, 'output_format'):
+        options.output_format = config.get(section, 'output_format')
+    else:
+        options.output_format = 'gtiff'
+    if options.output_format not in ('gtiff', 'cog'):
+        raise ValueError('Unknown output_format: %s' % options.output_format)
+    if config.has_option(section, 'compress'):
+        options.compress = config.get(section, 'compress')
+    else:
+        options.compress = 'deflate'
+    if config.has_option(section, 'compress_level'):
+        options.compress_level = config.getint(section, 'compress_level')
+    else:
+        options.compress_level = 9
+    if config.has_option(section, 'predictor'):
+        options.predictor = config.getint(section, 'predictor')
+    else:
+        options.predictor = 2
+    if config.has_option(section, 'blocksize'):
+        options.blocksize = config.getint(section, 'blocksize')
+    else:
+        options.blocksize = None
+    if config.has_option(section, 'overview_levels'):
+        options.overview_levels = [
+            int(x) for x in config.get(section, 'overview_levels').split(',')]
+    else:
+        options.overview_levels = [2, 4, 8, 16]
+    if config.has_option(section, 'overview_resampling'):
+        options.overview_resampling = config.get(section,
+                                                 'overview_resampling')
+    else:
+        options.overview_resampling = 'nearest'
+    if config.has_option(section, 'tile_workers'):
+        options.tile_workers = config.getint(section, 'tile_workers')
+    else:
+        options.tile_workers = 1
+    if config.has_option(section, 'band_workers'):
+        options.band_workers = config.getint(section, 'band_workers')
+    else:
+        options.band_workers = 1
+    if config.has_option(section, 'package_workers'):
+        options.package_workers = config.getint(section, 'package_workers')
+    else:
+        options.package_workers = 1
+    if config.has_option(section, 'input_mode'):
+        options.input_mode = config.get(section, 'input_mode')
+    else:
+        options.input_mode = 'extract'
+    if options.input_mode not in ('extract', 'vsitar'):
+        raise ValueError('Unknown input_mode: %s' % options.input_mode)
+    if config.has_option(section, 'decompressor'):
+        options.decompressor = config.get(section, 'decompressor')
+    else:
+        options.decompressor = 'auto'
+    if options.decompressor not in ('auto', 'igzip', 'pigz', 'tarfile'):
+        raise ValueError('Unknown decompressor: %s' % options.decompressor)
+    if config.has_option(section, 'prefetch'):
+        options.prefetch = config.getboolean(section, 'prefetch')
+    else:
+        options.prefetch = False
+    if config.has_option(section, 'prefetch_reserve_mb'):
+        options.prefetch_reserve_mb = config.getint(section,
+                                                    'prefetch_reserve_mb')
+    else:
+        options.prefetch_reserve_mb = 0
     if config.has_option(section, 'products'):
         options.products = config.get(section, 'products').split(',')
     else:
@@ -130,3 +199,22 @@ def determine_output_products(conf, product):
         raise ValueError('Product not found: %s' % product)
     return {k: v for k, v in conf['rename'].items()
             if v in conf['package'][product]}
+
+
+def determine_required_bands(conf, products):
+    """Get the input band names needed to create the given products.
+
+    Args:
+        conf (dict): raw structure from `read_processing_config`
+        products (list): products listed under 'package'
+
+    Returns:
+        list: input band names (keys under 'rename')
+
+    Example:
+        >>> determine_required_bands(conf, ['BT'])
+        ['bt_band6', 'pixel_qa', 'radsat_qa']
+
+    """
+    return sorted(set(band for product in products
+                      for band in determine_output_products(conf, product)))
@@ -1,12 +1,139 @@
 """Methods for pre-defined database interactions."""
 
+import os
+import time
+import atexit
+import signal
+import threading
+from collections import OrderedDict
+
 import cx_Oracle
 
 from util import logger
 
 
+# Sessions held open by each pooled connection manager
+POOL_MAX_SESSIONS = 4
+
+# Seconds a connection may sit unused before it is checked on reuse
+POOL_PING_INTERVAL = 60.0
+
+# Scene state change written by SceneStateWriter
+SCENE_STATE_SQL = (
+    "update ARD_PROCESSED_SCENES set PROCESSING_STATE = :state, "
+    "DATE_PROCESSED = sysdate where scene_id = :scene_id"
+)
+
+
+def session_pool(connstr):
+    """Create an Oracle session pool, or None if pooling is unavailable.
+
+    Args:
+        connstr (str): Oracle formatted connection string
+
+    Returns:
+        cx_Oracle.SessionPool: pool of sessions to the database
+
+    """
+    try:
+        user, rest = connstr.split('/', 1)
+        password, dsn = rest.rsplit('@', 1)
+        return cx_Oracle.SessionPool(user, password, dsn, min=1,
+                                     max=POOL_MAX_SESSIONS, increment=1,
+                                     threaded=True)
+    except (ValueError, AttributeError, cx_Oracle.Error):
+        logger.warning('Session pool unavailable, using direct connections')
+        return None
+
+
+class ConnectionManager(object):
+    """Reuse one open connection per process, thread and database.
+
+    Connections come from a cx_Oracle.SessionPool, or from plain
+    cx_Oracle.connect when no pool can be created.  A connection left
+    unused for POOL_PING_INTERVAL seconds is checked before it is reused,
+    so that a dropped session is replaced without a round trip on every
+    query.  Forked children never reuse their parent's sessions.
+
+    """
+
+    def __init__(self):
+        """Start without any pools or connections."""
+        self.lock = threading.Lock()
+        self.pools = dict()
+        self.connections = dict()
+        self.last_used = dict()
+
+    def pool(self, connstr):
+        """Get this process' session pool for connstr."""
+        key = (os.getpid(), connstr)
+        with self.lock:
+            if key not in self.pools:
+                self.pools[key] = session_pool(connstr)
+            return self.pools[key]
+
+    def connect(self, connstr):
+        """Get an open connection for the calling thread."""
+        key = (os.getpid(), threading.current_thread().ident, connstr)
+        connection = self.connections.get(key)
+        now = time.time()
+        if connection is not None:
+            idle = now - self.last_used.get(key, now)
+            self.last_used[key] = now
+            if idle < POOL_PING_INTERVAL:
+                return connection
+            try:
+                connection.ping()
+                return connection
+            except cx_Oracle.Error:
+                logger.warning('Database connection lost, reconnecting')
+                self.release(key)
+
+        pool = self.pool(connstr)
+        connection = None
+        if pool is not None:
+            try:
+                connection = pool.acquire()
+            except cx_Oracle.Error:
+                logger.warning('Session pool exhausted, connecting directly')
+        if connection is None:
+            connection = cx_Oracle.connect(connstr)
+        self.connections[key] = connection
+        self.last_used[key] = now
+        return connection
+
+    def release(self, key):
+        """Return a connection to its pool, or close it."""
+        connection = self.connections.pop(key, None)
+        self.last_used.pop(key, None)
+        if connection is None:
+            return
+        pool = self.pools.get((key[0], key[2]))
+        try:
+            if pool is not None:
+                pool.release(connection)
+            else:
+                connection.close()
+        except cx_Oracle.Error:
+            try:
+                connection.close()
+            except cx_Oracle.Error:
+                pass
+
+    def close(self):
+        """Release all connections held by this process."""
+        pid = os.getpid()
+        for key in list(self.connections):
+            if key[0] == pid:
+                self.release(key)
+
+
+connections = ConnectionManager()
+atexit.register(connections.close)
+
+
 def connect(connstr):
-    """Open a new Oracle DB connection.
+    """Get an open Oracle DB connection, reusing pooled sessions.
 
     Args:
         connstr (str): Oracle formatted connection string
@@ -19,7 +146,7 @@ def connect(connstr):
         <cx_Oracle.Connection to schema/secret@host:port/database>
     """
     try:
-        return cx_Oracle.connect(connstr)
+        return connections.connect(connstr)
     except Exception:
         logger.exception('Unable to connect to database!')
         raise
@@ -90,14 +217,71 @@ def update_many(connection, sql, array=None):
     connection.commit()
 
 
-def update_scene_state(connection, scene_id, state):
-    """Update state of a scene record in ARD_PROCESSED_SCENES table."""
-    ard_processed_scenes_update = (
-        "update ARD_PROCESSED_SCENES set PROCESSING_STATE = :state, "
-        "DATE_PROCESSED = sysdate where scene_id = :scene_id"
-    )
-    update(connection, ard_processed_scenes_update,
-           state=state, scene_id=scene_id)
+class SceneStateWriter(object):
+    """Batch ARD_PROCESSED_SCENES state changes into few commits.
+
+    State changes are buffered, the latest per scene winning, and written
+    with one executemany and commit when flush() is called.  The clip job
+    flushes as each scene starts, so a scene's final state is committed
+    along with the next scene's INWORK.
+
+    """
+
+    def __init__(self, connstr):
+        """Buffer state changes for the database at connstr."""
+        self.connstr = connstr
+        self.pending = OrderedDict()
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def set_state(self, scene_id, state):
+        """Queue a new processing state for a scene."""
+        with self.lock:
+            self.pending.pop(scene_id, None)
+            self.pending[scene_id] = state
+
+    def flush(self):
+        """Write all pending state changes in a single transaction."""
+        if os.getpid() != self.pid:
+            return  # Forked children leave the writes to their parent
+        with self.lock:
+            rows = [{'scene_id': scene_id, 'state': state}
+                    for scene_id, state in self.pending.items()]
+            self.pending.clear()
+        if not rows:
+            return
+        logger.debug('Write %d scene states', len(rows))
+        try:
+            update_many(connect(self.connstr), SCENE_STATE_SQL, rows)
+        except BaseException:
+            # Keep the states not superseded meanwhile for the next flush
+            with self.lock:
+                for row in rows:
+                    self.pending.setdefault(row['scene_id'], row['state'])
+            raise
+
+    def flush_on_exit(self, *signums):
+        """Write pending state changes at exit, including on signals.
+
+        The signal handlers only raise SystemExit in the main thread, so
+        that it unwinds, releasing the lock, before the exit flush runs.
+        Forked children keep the previous handling of the signals.
+
+        """
+        atexit.register(self.flush)
+        for signum in signums:
+            previous = signal.getsignal(signum)
+
+            def handler(signum, frame, previous=previous):
+                if os.getpid() == self.pid:
+                    raise SystemExit(128 + signum)
+                if callable(previous):
+                    previous(signum, frame)
+                elif previous != signal.SIG_IGN:
+                    signal.signal(signum, signal.SIG_DFL)
+                    os.kill(os.getpid(), signum)
+
+            signal.signal(signum, handler)
 
 
 def insert_tile_record(connection, completed_tile_list):
@@ -110,23 +294,9 @@ def insert_tile_record(connection, completed_tile_list):
     update_many(connection, processed_tiles_insert, completed_tile_list)
 
 
-def select_consecutive_scene(connection, acqdate, wrsrow, wrspath,
-                             n=2, **kwargs):
-    """Select same-day scene ids from consective WRS_ROWs along a WRS_PATH."""
-    ls_prod_id_sql = ("select distinct LANDSAT_SCENE_ID from "
-                      "  inventory.LMD_SCENE where "
-                      "  trunc(DATE_ACQUIRED) = to_date(:acqdate,'YYYYMMDD') "
-                      "  and LANDSAT_PRODUCT_ID is not null "
-                      "  and WRS_ROW >= :minrow and WRS_ROW <= :maxrow "
-                      "  and WRS_PATH = :wrspath")
-    results = select(connection, ls_prod_id_sql,
-                     acqdate=acqdate, minrow=int(wrsrow)-n,
-                     maxrow=int(wrsrow)+n, wrspath=int(wrspath))
-    return [r['LANDSAT_SCENE_ID'] for r in results]
-
-
-def select_corner_polys(connection, scene_ids):
-    """Get coordinates for input scene list."""
+def select_consecutive_corner_polys(connection, acqdate, wrspath, minrow,
+                                    maxrow):
+    """Get coordinates of same-day scenes from WRS_ROWs along a WRS_PATH."""
     poly_intersect_sql = (
         "select LANDSAT_PRODUCT_ID, "
         " 'POLYGON ((' ||  CORNER_UL_LON || ' ' || CORNER_UL_LAT || ',' || "
@@ -134,31 +304,55 @@ def select_corner_polys(connection, scene_ids):
         " CORNER_LR_LON || ' ' || CORNER_LR_LAT || ',' || "
         " CORNER_UR_LON || ' ' || CORNER_UR_LAT || ',' || "
         " CORNER_UL_LON || ' ' || CORNER_UL_LAT || '))' AS COORDS "
-        " from SCENE_COORDINATE_MASTER_V where LANDSAT_SCENE_ID in ({})"
+        " from SCENE_COORDINATE_MASTER_V where LANDSAT_SCENE_ID in ("
+        "  select distinct LANDSAT_SCENE_ID from inventory.LMD_SCENE where "
+        "  trunc(DATE_ACQUIRED) = to_date(:acqdate,'YYYYMMDD') "
+        "  and LANDSAT_PRODUCT_ID is not null "
+        "  and WRS_ROW >= :minrow and WRS_ROW <= :maxrow "
+        "  and WRS_PATH = :wrspath)"
         " order by LANDSAT_PRODUCT_ID desc"
     )
-    # Oracle does not support binding for IN
-    scene_ids_fmtd = ",".join(["'%s'" % x for x in scene_ids])
-    poly_intersect_sql = poly_intersect_sql.format(scene_ids_fmtd)
-    return select(connection, poly_intersect_sql)
+    return select(connection, poly_intersect_sql, acqdate=acqdate,
+                  minrow=int(minrow), maxrow=int(maxrow),
+                  wrspath=int(wrspath))
 
 
-def check_tile_status(connection, tile_id):
-    """Fetch information about an already completed tile id."""
-    tile_status_sql = (
-        "select tile_id, contributing_scenes, complete_tile"
-        " from ARD_COMPLETED_TILES where tile_id = :tile_id"
-    )
-    return select(connection, tile_status_sql, tile_id=tile_id)
+def completed_tiles(connection, tile_ids, chunk_size=1000):
+    """Select which of the tile ids are already in ARD_COMPLETED_TILES.
+
+    Args:
+        connection (cx_Oracle.Connection): open database connection object
+        tile_ids (list): candidate tile ids
+        chunk_size (int): most ids per query, Oracle's IN list limit
 
+    Returns:
+        set: tile ids which have already been completed
 
-def fetch_file_loc(connection, sat, wildcard):
-    """Wildcard search for File Locations by mission and glob."""
-    wildcard = '%{w}%'.format(w=wildcard)
+    """
+    tile_ids = list(tile_ids)
+    completed = set()
+    for start in range(0, len(tile_ids), chunk_size):
+        chunk = tile_ids[start:start + chunk_size]
+        binds = {'id%d' % i: tile_id for i, tile_id in enumerate(chunk)}
+        tile_status_sql = (
+            "select tile_id from ARD_COMPLETED_TILES where tile_id in ({})"
+            .format(','.join(':id%d' % i for i in range(len(chunk))))
+        )
+        completed.update(r['TILE_ID']
+                         for r in select(connection, tile_status_sql, **binds))
+    return completed
+
+
+def fetch_path_file_locs(connection, sat, wrspath, acqdate):
+    """Select File Locations of all scenes along a WRS_PATH on one day."""
     file_loc_sql = (
         "select FILE_LOC, LANDSAT_PRODUCT_ID"
         " from ARD_L2_ALBERS_INVENTORY_V where"
-        " SATELLITE = :sat AND LANDSAT_PRODUCT_ID like :wildcard"
+        " SATELLITE = :sat AND WRS_PATH = :wrspath"
+        " AND DATE_ACQUIRED >= to_date(:acqdate, 'YYYYMMDD')"
+        " AND DATE_ACQUIRED < to_date(:acqdate, 'YYYYMMDD') + 1"
         " order by LANDSAT_PRODUCT_ID desc"
     )
-    return select(connection, file_loc_sql, sat=sat, wildcard=wildcard)
+    # The view's WRS_PATH is a zero padded substring of the product id
+    return select(connection, file_loc_sql, sat=sat,
+                  wrspath='{0:03d}'.format(int(wrspath)), acqdate=acqdate)
@@ -1,13 +1,18 @@
 """Intersect footprints/grids or parse geospatial datasets."""
 import os
 import sys
+import json
+import fnmatch
 import urllib2
+import tarfile
+import threading
 
 from osgeo import gdal, osr, ogr
 import numpy as np
 
 import db
 import landsat
+import util
 from util import logger
 
 
@@ -83,58 +88,179 @@ def parseHistFile(histFilename):
             countShadow, countCloud)
 
 
-def parse_gdal_hist_output(gdal_hist_output):
-    """Count histogram values from Lineage-QA, for potential all fill"""
-    bucket_index = [i for i, line in enumerate(gdal_hist_output)
-                    if 'buckets from ' in line].pop()
-    histArray = gdal_hist_output[bucket_index + 1].split()
-    count1 = long(histArray[1])
-    count2 = long(histArray[2])
-    count3 = long(histArray[3])
+# Member names of each plain tar read through /vsitar/, listed once
+tar_members = dict()
+tar_members_lock = threading.Lock()
 
-    # save scene pixel counts into an array and return to caller
-    scenePixelCountArray = []
-    scenePixelCountArray.append(count1)
-    scenePixelCountArray.append(count2)
-    scenePixelCountArray.append(count3)
 
-    return (count1 > 0) + (count2 > 0) + (count3 > 0), scenePixelCountArray
+def list_tar_members(archive):
+    """List the member names of a plain tar archive, once per process."""
+    with tar_members_lock:
+        if archive not in tar_members:
+            with tarfile.open(archive, 'r:') as tar:
+                tar_members[archive] = tar.getnames()
+        return tar_members[archive]
 
 
-def sum_counts(unique_values, count_list, target_bit):
-    """Return counts for each cover type."""
-    # determine if each unique value contains target bit
-    bit_bool = unique_values & 1 << target_bit > 0
+def find_scene_band(source, band_name):
+    """Find a scene band, either unpacked or inside a GDAL /vsitar/ archive.
 
-    # sum counts from all values containing target bit
-    final_count = np.sum(np.array(count_list)[bit_bool])
+    Args:
+        source (str): scene directory, or /vsitar/ path to the plain tar
+            scene bundle
+        band_name (str): band name suffix (e.g. 'toa_band1')
+
+    Returns:
+        str: path to band GeoTIFF openable by GDAL
+
+    """
+    pattern = '*' + band_name + '.tif'
+    if not source.startswith('/vsitar/'):
+        return util.ffind(source, pattern)
+
+    archive = source[len('/vsitar/'):]
+    matches = fnmatch.filter(list_tar_members(archive), pattern)
+    if matches:
+        return source + '/' + matches.pop()
+    logger.error('No file matches %s/%s', source, pattern)
+
+
+def read_array(raster_in, band=1):
+    """Read a single raster band fully into memory."""
+    ds = gdal.Open(raster_in)
+    if ds is None:
+        logger.error('Could not open %s', raster_in)
+        raise IOError('Could not open %s' % raster_in)
+    return ds.GetRasterBand(band).ReadAsArray()
+
+
+def write_browse(filenames, destination, scale_max=10000,
+                 overviews=(2, 4, 8, 16)):
+    """Write a JPEG compressed RGB browse with internal overviews.
+
+    Each band is scaled linearly from 0..scale_max to 0..255, as done by
+    `gdal_translate -scale 0 scale_max -ot Byte`, with values outside the
+    range clamped to it.
 
-    return final_count
+    Args:
+        filenames (list): paths to red, green and blue band rasters
+        destination (str): path to output GeoTIFF
+        scale_max (int): band value mapped to 255
+        overviews (tuple): overview decimation factors
+
+    """
+    template = gdal.Open(filenames[0])
+    if template is None:
+        raise IOError('Could not open %s' % filenames[0])
+    rgb = gdal.GetDriverByName('MEM').Create(
+        '', template.RasterXSize, template.RasterYSize, len(filenames),
+        gdal.GDT_Byte)
+    rgb.SetGeoTransform(template.GetGeoTransform())
+    rgb.SetProjection(template.GetProjection())
+
+    for index, filename in enumerate(filenames, 1):
+        scaled = read_array(filename).astype(np.float32)
+        scaled *= 255.0 / scale_max
+        scaled += 0.5
+        np.clip(scaled, 0, 255, out=scaled)
+        rgb.GetRasterBand(index).WriteArray(scaled.astype(np.uint8))
+
+    output = gdal.GetDriverByName('GTiff').CreateCopy(
+        destination, rgb, options=['compress=jpeg', 'photometric=ycbcr'])
+    if output is None:
+        raise IOError('Unable to write %s' % destination)
+    output = None  # Flush and close the output
+
+    # Internal pyramids are added to the written file, as gdaladdo does,
+    # since MEM datasets only support overviews from GDAL 2.1
+    output = gdal.Open(destination, gdal.GA_Update)
+    if output is None:
+        raise IOError('Could not open %s' % destination)
+    if output.BuildOverviews('NEAREST', list(overviews)) != gdal.CE_None:
+        raise RuntimeError('Unable to build overviews of %s' % destination)
+    output = None
+
+
+def raster_histogram(raster_in, band=1, bins=65536):
+    """Count each value of an unsigned 16-bit raster band.
+
+    The band is read one row of native blocks at a time, so memory use is
+    bounded by the block height rather than the raster size.
 
+    Args:
+        raster_in (str): path to raster
+        band (int): band number to count
+        bins (int): number of distinct values the band can hold
+
+    Returns:
+        numpy.ndarray: pixel count for each value
 
-def raster_value_count(raster_in, tile_id):
-    """Parse Pixel-QA GTIFF file for metadata percentages."""
-    # open raster, read first band as array
+    """
     ds = gdal.Open(raster_in)
-    band_arr = np.array(ds.GetRasterBand(1).ReadAsArray())
-
-    # get unique values from array
-    uni, counts = np.unique(band_arr, return_counts=True)
-
-    # count bits
-    bit_counts = {
-        'fill': sum_counts(uni, counts, 0),
-        'clear': sum_counts(uni, counts, 1),
-        'water': sum_counts(uni, counts, 2),
-        'cloud_shadow': sum_counts(uni, counts, 3),
-        'snow_ice': sum_counts(uni, counts, 4),
-        'cloud_cover': sum_counts(uni, counts, 5),
-    }
-
-    # get high-conf cirrus and terrain occlusion for L8
+    if ds is None:
+        logger.error('Could not open %s', raster_in)
+        raise IOError('Could not open %s' % raster_in)
+    raster_band = ds.GetRasterBand(band)
+    block_rows = raster_band.GetBlockSize()[1]
+
+    histogram = np.zeros(bins, dtype=np.int64)
+    for yoff in range(0, ds.RasterYSize, block_rows):
+        rows = min(block_rows, ds.RasterYSize - yoff)
+        block = raster_band.ReadAsArray(0, yoff, ds.RasterXSize, rows)
+        histogram += np.bincount(block.ravel(), minlength=bins)[:bins]
+    return histogram
+
+
+# Pixel-QA bit of each cover type counted for the metadata
+PIXELQA_BITS = {
+    'fill': 0,
+    'clear': 1,
+    'water': 2,
+    'cloud_shadow': 3,
+    'snow_ice': 4,
+    'cloud_cover': 5,
+}
+
+# High-confidence cirrus and terrain occlusion, only flagged for L8
+PIXELQA_L8_BITS = {
+    'cirrus': 9,
+    'terrain': 10,
+}
+
+# Whether each 16-bit value has each bit set, indexed [value, bit]
+BIT_TABLE = ((np.arange(65536, dtype=np.uint32)[:, np.newaxis] >>
+              np.arange(16, dtype=np.uint32)) & 1).astype(np.uint8)
+
+
+def histogram_bit_counts(histogram, tile_id):
+    """Count the Pixel-QA pixels of each cover type from a histogram.
+
+    Args:
+        histogram (numpy.ndarray): pixel count of each 16-bit value
+        tile_id (str): tile id, deciding which cover types apply
+
+    Returns:
+        dict: pixel count for each cover type
+
+    """
+    bits = dict(PIXELQA_BITS)
     if tile_id.startswith('LC08'):
-        bit_counts['cirrus'] = sum_counts(uni, counts, 9)
-        bit_counts['terrain'] = sum_counts(uni, counts, 10)
+        bits.update(PIXELQA_L8_BITS)
+    names = sorted(bits)
+    counts = histogram.dot(BIT_TABLE[:, [bits[n] for n in names]])
+    return dict(zip(names, counts))
+
+
+def raster_value_count(raster_in, tile_id, histogram=None):
+    """Parse Pixel-QA GTIFF file for metadata percentages.
+
+    The histogram counted in memory before the file was written is used
+    when given, otherwise the file is read to build it.
+
+    """
+    if histogram is None:
+        histogram = raster_histogram(raster_in)
+    bit_counts = histogram_bit_counts(histogram, tile_id)
 
     logger.debug('        # pixels Fill: %s',
                  bit_counts.get('fill'))
@@ -186,21 +312,30 @@ def get_tile_scene_intersections(connection, product_id, region, n=2):
 
     """
     # We need to get 2 consecutive wrsRows north and 2 consecutive wrsRows
-    # south of input scene to account for possible 3 scene tile.
+    # south of input scene to account for possible 3 scene tile.  The
+    # precomputed path/row table, when built, narrows down the rows which
+    # may share a tile with the input scene.
     id_info = landsat.match(product_id)
-    logger.info('Select consecutive scenes for %s', product_id)
-    ls_prod_id_scenes = db.select_consecutive_scene(connection, n=n,
-                                                    **id_info)
-    pathrow_range_list = ['_{0:3s}{1:03d}_'.format(id_info['wrspath'],
-                          int(id_info['wrsrow']) + wrs_row_x)
-                          for wrs_row_x in range(-n, n+1)]
+    pathrow = id_info['wrspath'] + id_info['wrsrow']
+    candidates = (pathrow_table(region) or {}).get(pathrow)
+    row = int(id_info['wrsrow'])
+    wrs_rows = range(row - n, row + n + 1)
+    if candidates is not None:
+        wrs_rows = sorted(set(wrs_rows).intersection(
+            r for key in candidates for r in candidates[key])) or [row]
+    pathrow_range_list = ['_{0:3s}{1:03d}_'.format(id_info['wrspath'], r)
+                          for r in wrs_rows]
 
     tile_list = []
     tilepath_scenes = {}
 
-    if len(ls_prod_id_scenes) > 0:
-        # Get coordinates for input scene and north and south scene.
-        results = db.select_corner_polys(connection, ls_prod_id_scenes)
+    # Get coordinates for input scene and north and south scene.
+    logger.info('Select consecutive scenes for %s', product_id)
+    results = db.select_consecutive_corner_polys(
+        connection, acqdate=id_info['acqdate'], wrspath=id_info['wrspath'],
+        minrow=min(wrs_rows), maxrow=max(wrs_rows))
+
+    if len(results) > 0:
         scene_records = [r for r in results
                          if any(x in r['LANDSAT_PRODUCT_ID'] for x in
                                 pathrow_range_list)]
@@ -214,38 +349,36 @@ def get_tile_scene_intersections(connection, product_id, region, n=2):
 
         # Find all the tiles that intersect the input scene
         # and put into a list
-        region_shapefile = read_shapefile(region=region)
-
-        layer = region_shapefile.GetLayer()
-        spatialRef = layer.GetSpatialRef()
+        grid = tile_grid(region)
         for name in scene_records.keys():
-            scene_records[name].AssignSpatialReference(spatialRef)
-
-        for feature2 in layer:
-            geom2 = feature2.GetGeometryRef()
-
-            # select only the intersections
-            if geom2.Intersects(scene_records[product_id]):
-                tile = {
-                    'H':    feature2.GetField('H'),
-                    'V':    feature2.GetField('V'),
-                    'UL_X': feature2.GetField('UL_X'),
-                    'LL_Y': feature2.GetField('LL_Y'),
-                    'LR_X': feature2.GetField('LR_X'),
-                    'UR_Y': feature2.GetField('UR_Y'),
-                }
-                tile_list.append(tile)
-
-                for name in scene_records.keys():
-                    # Add path, row of input scene to dictionary
-                    key = 'H{H:03d}V{V:03d}'.format(**tile)
-                    # Now see if tile intersects with north and south scene
-                    # and put into a dictionary
-                    if geom2.Intersects(scene_records[name]):
-                        if key not in tilepath_scenes:
-                            tilepath_scenes[key] = list()
-
-                        tilepath_scenes[key].append(landsat.match(name))
+            scene_records[name].AssignSpatialReference(grid.spatial_ref)
+
+        # Only the precomputed candidate tiles, and the rows which may
+        # reach them, need exact tests when the path/row table is built
+        names = list(scene_records.keys())
+        mask = None
+        if candidates is None:
+            indexes = grid.candidates(scene_records[product_id])
+        else:
+            keys = sorted(k for k in candidates if k in grid.index)
+            indexes = [grid.index[k] for k in keys]
+            rows = [int(landsat.match(name)['wrsrow']) for name in names]
+            mask = np.array([[row in candidates[k] for k in keys]
+                             for row in rows], dtype=bool)
+
+        # Scene by tile intersections, in a single pass
+        hits = grid.intersection_matrix([scene_records[name]
+                                         for name in names], indexes, mask)
+
+        for t in np.flatnonzero(hits[names.index(product_id)]):
+            tile = dict(grid.tiles[indexes[t]])
+            tile_list.append(tile)
+
+            # Add path, row of input scene to dictionary, with the north
+            # and south scenes which also intersect the tile
+            key = 'H{H:03d}V{V:03d}'.format(**tile)
+            tilepath_scenes[key] = [landsat.match(names[i])
+                                    for i in np.flatnonzero(hits[:, t])]
 
     logger.info('Tile list: {0}'.format(tile_list))
     logger.info('Neighboring scenes: {0}'.format(tilepath_scenes))
@@ -272,3 +405,136 @@ def read_shapefile(region='', ard_aux_dir=None):
         logger.error('Could not open {0}'.format(region_shp_filename))
         raise IOError('Could not open {0}'.format(region_shp_filename))
     return region_shapefile
+
+
+class TileGrid(object):
+    """In-memory ARD tile grid of a region, indexed by extent and H/V.
+
+    Tile envelopes are kept as a NumPy array so that candidate tiles for a
+    geometry are found with one vectorized overlap test, leaving the exact
+    OGR intersection test for the few tiles which pass it.
+
+    """
+
+    # Tile fields passed along with each intersecting tile
+    TILE_FIELDS = ('H', 'V', 'UL_X', 'LL_Y', 'LR_X', 'UR_Y')
+
+    # Geographic bounds of each tile, for the metadata
+    BOUND_FIELDS = ('LAT_NORTH', 'LAT_SOUTH', 'LON_WEST', 'LON_EAST')
+
+    def __init__(self, region_shapefile):
+        """Read all tiles of an opened region shapefile."""
+        layer = region_shapefile.GetLayer()
+        self.spatial_ref = layer.GetSpatialRef().Clone()
+        self.tiles = []
+        self.geometries = []
+        self.bounds = dict()
+        self.index = dict()
+        envelopes = []
+        for feature in layer:
+            tile = {k: feature.GetField(k) for k in self.TILE_FIELDS}
+            geometry = feature.GetGeometryRef().Clone()
+            self.index['H{H:03d}V{V:03d}'.format(**tile)] = len(self.tiles)
+            self.tiles.append(tile)
+            self.geometries.append(geometry)
+            self.bounds[(tile['H'], tile['V'])] = {
+                k: feature.GetField(k) for k in self.BOUND_FIELDS}
+            envelopes.append(geometry.GetEnvelope())
+        # Columns are min x, max x, min y, max y
+        self.envelopes = np.array(envelopes, dtype=np.float64).reshape(-1, 4)
+
+    def candidates(self, geometry):
+        """Indexes of tiles whose envelope overlaps the geometry's."""
+        min_x, max_x, min_y, max_y = geometry.GetEnvelope()
+        env = self.envelopes
+        overlaps = ((env[:, 0] <= max_x) & (env[:, 1] >= min_x) &
+                    (env[:, 2] <= max_y) & (env[:, 3] >= min_y))
+        return np.flatnonzero(overlaps)
+
+    def intersects(self, index, geometry):
+        """Exact intersection test of one tile against a geometry."""
+        return self.geometries[index].Intersects(geometry)
+
+    def intersection_matrix(self, geometries, indexes=None, mask=None):
+        """Which of the tiles each geometry intersects.
+
+        Envelopes of every geometry and tile are compared at once, and the
+        exact intersection only tested where the envelopes overlap.
+
+        Args:
+            geometries (list): OGR geometries to intersect
+            indexes (list): tiles to test, defaults to all tiles
+            mask (numpy.ndarray): geometry by tile pairs worth testing
+
+        Returns:
+            numpy.ndarray: boolean array of geometries by tiles
+
+        """
+        if indexes is None:
+            indexes = np.arange(len(self.tiles))
+        indexes = np.asarray(indexes, dtype=np.intp)
+        tiles = self.envelopes[indexes]
+        geoms = np.array([g.GetEnvelope() for g in geometries],
+                         dtype=np.float64).reshape(-1, 4)
+        hits = ((tiles[np.newaxis, :, 0] <= geoms[:, np.newaxis, 1]) &
+                (tiles[np.newaxis, :, 1] >= geoms[:, np.newaxis, 0]) &
+                (tiles[np.newaxis, :, 2] <= geoms[:, np.newaxis, 3]) &
+                (tiles[np.newaxis, :, 3] >= geoms[:, np.newaxis, 2]))
+        if mask is not None:
+            hits &= mask
+        for g, t in zip(*np.nonzero(hits)):
+            hits[g, t] = self.intersects(indexes[t], geometries[g])
+        return hits
+
+    def intersecting(self, geometry):
+        """Indexes of all tiles intersecting the geometry, in grid order."""
+        return [i for i in self.candidates(geometry)
+                if self.intersects(i, geometry)]
+
+
+# Tile grids already read by this process, by region
+tile_grids = dict()
+tile_grids_lock = threading.Lock()
+
+
+def tile_grid(region, ard_aux_dir=None):
+    """Get the tile grid of a region, reading its shapefile only once."""
+    with tile_grids_lock:
+        if region not in tile_grids:
+            tile_grids[region] = TileGrid(read_shapefile(region, ard_aux_dir))
+            logger.info('Indexed %d %s tiles', len(tile_grids[region].tiles),
+                        region)
+        return tile_grids[region]
+
+
+# Precomputed path/row to tile tables, as written by build_pathrow_tiles
+PATHROW_TABLE = '{region}_pathrow_tiles.json'
+
+# Path/row tables already read by this process, by region
+pathrow_tables = dict()
+
+
+def pathrow_table(region, ard_aux_dir=None):
+    """Get the precomputed path/row to tile table of a region.
+
+    Returns:
+        dict: {pathrow: {tile key: [rows which may cover the tile]}}, or
+            None if no table has been built for the region
+
+    """
+    with tile_grids_lock:
+        if region not in pathrow_tables:
+            if ard_aux_dir is None:
+                ard_aux_dir = os.getenv('ARD_AUX_DIR', '')
+            filename = os.path.join(ard_aux_dir,
+                                    PATHROW_TABLE.format(region=region))
+            table = None
+            if os.path.isfile(filename):
+                logger.debug('Read path/row table %s', filename)
+                with open(filename) as fid:
+                    table = json.load(fid)
+            else:
+                logger.info('No path/row table %s, scanning the grid',
+                            filename)
+            pathrow_tables[region] = table
+        return pathrow_tables[region]
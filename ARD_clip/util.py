@@ -3,17 +3,38 @@
 import os
 import sys
 import glob
+import gzip
+import mmap
 import stat
+import fcntl
 import shlex
 import shutil
+import fnmatch
 import hashlib
 import logging
 import tarfile
+import threading
 import subprocess
+from contextlib import contextmanager
+from distutils.spawn import find_executable
 
 
 logger = logging.getLogger()
 
+# Bytes read at a time when digesting files
+CHECKSUM_BLOCKSIZE = 1024 * 1024
+
+# Digests already computed this run, keyed by file identity and mtime
+checksum_cache = dict()
+checksum_lock = threading.Lock()
+
+# External gzip inflaters writing the decompressed tar stream to stdout,
+# in order of preference for the 'auto' decompressor
+DECOMPRESSORS = (
+    ('igzip', ['igzip', '-d', '-c']),
+    ('pigz', ['pigz', '-d', '-c']),
+)
+
 
 class L2pgsLoggingFilter(logging.Filter):
     """Set subsystem name via logging filter, for later log parsing."""
@@ -133,92 +154,297 @@ def make_file_group_writeable(filename):
     os.chmod(filename, st.st_mode | stat.S_IWGRP)
 
 
-def checksum_md5(filename):
+def checksum_md5(filename, blocksize=CHECKSUM_BLOCKSIZE, use_mmap=False):
     """Calculate the MD5 hex digest of input filename.
 
+    The file is digested in blocks so memory use stays bounded, and the
+    result cached against the file's identity, size and modification time
+    so that the same file is only read once per run.
+
     Args:
         filename (str): path to file to digest
+        blocksize (int): bytes to read at a time
+        use_mmap (bool): digest a memory map of the file instead of reads
 
     Returns:
         str: md5 checksum
 
     """
-    return hashlib.md5(open(filename, 'rb').read()).hexdigest()
-
+    stats = os.stat(filename)
+    key = (os.path.realpath(filename), stats.st_ino, stats.st_size,
+           stats.st_mtime)
+    with checksum_lock:
+        if key in checksum_cache:
+            return checksum_cache[key]
+
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as fid:
+        if use_mmap and stats.st_size > 0:
+            view = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, stats.st_size, blocksize):
+                    md5.update(view[offset:offset + blocksize])
+            finally:
+                view.close()
+        else:
+            for block in iter(lambda: fid.read(blocksize), b''):
+                md5.update(block)
 
-def process_checksums(globext, workdir, output_path):
-    """Create md5 checksum files for all matching file types, and
-       compare with local files.
+    md5hash = md5.hexdigest()
+    with checksum_lock:
+        checksum_cache[key] = md5hash
+    return md5hash
 
-    Args:
-        globext (str): file glob to search for
-        output_path (str): output directory location
 
-    Returns:
-        str: status of operation [SUCCESS, ERROR]
+class HashingWriter(object):
+    """Write-only file wrapper which digests the data as it is written."""
 
-    """
-    fullnames = glob.glob(os.path.join(workdir, globext))
-    for fullname in fullnames:
-        md5name = fullname.replace('.tar', '.md5')
-        md5hash = checksum_md5(fullname)
-        basename = os.path.basename(fullname)
-        if md5hash != checksum_md5(os.path.join(output_path, basename)):
-            logging.error('%s checksums do not match.', basename)
-            return "ERROR"
-        else:
-            logger.info('%s checksums match.', basename)
+    def __init__(self, fileobj):
+        """Wrap an open, binary mode output file."""
+        self.fileobj = fileobj
+        self.md5 = hashlib.md5()
 
-        with open(md5name, 'w') as fid:
-            fid.write(' '.join([md5hash, basename]))
+    def write(self, data):
+        """Digest and write a block of data."""
+        self.md5.update(data)
+        self.fileobj.write(data)
 
-        md5name_out = os.path.join(output_path, os.path.basename(md5name))
-        shutil.copyfile(md5name, md5name_out)
-        make_file_group_writeable(md5name_out)
-        os.remove(md5name)
+    def hexdigest(self):
+        """MD5 hex digest of everything written so far."""
+        return self.md5.hexdigest()
 
-    return "SUCCESS"
 
+def tar_archive_md5(output_filename, files):
+    """Stream files into a single-layer tar archive, digesting as it goes.
 
-def tar_archive(output_filename, files):
-    """Combine files as single-layer tar archive.
+    The archive is written under a temporary name beside output_filename
+    and renamed once complete, so a partial archive is never left under
+    the final name.
 
     Args:
         output_filename (str): path to write tar archive
         files (list): full paths to files to add to archive
 
+    Returns:
+        str: md5 checksum of the archive as written
+
     """
     if not files:
         raise ValueError("No files to archive, cannot create %s" %
                          output_filename)
 
-    with tarfile.open(output_filename, "w") as tar:
-        for filename in files:
-            tar.add(filename, arcname=os.path.basename(filename))
+    partial = output_filename + '.partial'
+    try:
+        with open(partial, 'wb') as fid:
+            writer = HashingWriter(fid)
+            with tarfile.open(fileobj=writer, mode='w|') as tar:
+                for filename in files:
+                    tar.add(filename, arcname=os.path.basename(filename))
+            fid.flush()
+            os.fsync(fid.fileno())
+        os.rename(partial, output_filename)
+    finally:
+        remove(partial)
 
     make_file_group_writeable(output_filename)
+    return writer.hexdigest()
+
+
+def write_md5_file(filename, md5hash):
+    """Write the .md5 checksum file which accompanies filename."""
+    md5name = os.path.splitext(filename)[0] + '.md5'
+    with open(md5name, 'w') as fid:
+        fid.write(' '.join([md5hash, os.path.basename(filename)]))
+    make_file_group_writeable(md5name)
+    return md5name
+
+
+@contextmanager
+def file_lock(filename):
+    """Hold an exclusive lock on filename, shared by threads and processes.
+
+    Args:
+        filename (str): path to lock file, created if it does not exist
+
+    """
+    with open(filename, 'a') as fid:
+        fcntl.flock(fid, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fid, fcntl.LOCK_UN)
+
+
+def find_decompressor(decompressor='auto'):
+    """Find the external gzip inflater command to use.
+
+    Args:
+        decompressor (str): 'auto', 'igzip', 'pigz' or 'tarfile'
 
+    Returns:
+        list: command and arguments, or None to use Python's tarfile
+
+    """
+    if decompressor == 'tarfile':
+        return None
+    commands = dict(DECOMPRESSORS)
+    if decompressor != 'auto' and decompressor not in commands:
+        raise ValueError('Unknown decompressor: %s' % decompressor)
+    for name, command in DECOMPRESSORS:
+        if decompressor in ('auto', name) and find_executable(command[0]):
+            return command
+    if decompressor != 'auto':
+        logger.warning('%s not found, falling back to tarfile', decompressor)
+    return None
+
+
+@contextmanager
+def open_tar_stream(filename, decompressor='auto'):
+    """Open a tar.gz archive as a stream of members.
+
+    When an external inflater is available, the archive is decompressed
+    by it in a separate process and its output read by tarfile as a plain
+    tar stream, otherwise tarfile inflates the archive itself.
 
-def untar_archive(filename, directory='.'):
+    Args:
+        filename (str): path to tar.gz, or plain tar, archive
+        decompressor (str): 'auto', 'igzip', 'pigz' or 'tarfile'
+
+    """
+    command = find_decompressor(decompressor)
+    if command is None:
+        with tarfile.open(filename, 'r|*') as tar:
+            yield tar
+        return
+
+    logger.debug('Decompress with %s', ' '.join(command))
+    proc = subprocess.Popen(command + [filename], stdout=subprocess.PIPE)
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode='r|') as tar:
+            yield tar
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise IOError('%s failed on %s with status %d'
+                      % (command[0], filename, proc.returncode))
+
+
+def extract_members(filename, directory, patterns=None, decompressor='auto'):
+    """Stream the archive once, extracting members as they appear."""
+    with open_tar_stream(filename, decompressor) as tar:
+        for member in tar:
+            if patterns is None or any(
+                    fnmatch.fnmatch(os.path.basename(member.name), p)
+                    for p in patterns):
+                tar.extract(member, directory)
+
+
+def untar_archive(filename, directory='.', patterns=None,
+                  decompressor='auto'):
     """Extract into directory using basename as new folder name.
 
+    The archive is extracted into a temporary directory which is renamed
+    once complete, under a lock so that concurrent callers for the same
+    directory wait for the first extraction rather than repeat it.
+
     Args:
         filename (str): path to tar.gz archive
         directory (str): path to base directory to extract files
+        patterns (list): only extract members whose basename matches one
+            of these glob patterns (default: extract everything)
+        decompressor (str): 'auto', 'igzip', 'pigz' or 'tarfile'
 
     Returns:
         str: path to new created directory
 
     """
-    if make_dirs(directory):
-        logger.info('Unpacking tar: %s', filename)
-        tar = tarfile.open(filename, 'r:gz')
-        tar.extractall(directory)
-        tar.close()
-        logger.info('End unpacking tar')
+    directory = directory.rstrip(os.sep)
+    with file_lock(directory + '.lock'):
+        if not os.path.isdir(directory):
+            partial = directory + '.partial'
+            remove(partial)
+            make_dirs(partial)
+            logger.info('Unpacking tar: %s', filename)
+            try:
+                extract_members(filename, partial, patterns, decompressor)
+            except (IOError, tarfile.TarError):
+                if find_decompressor(decompressor) is None:
+                    raise
+                logger.exception('External decompressor failed,'
+                                 ' retrying with tarfile')
+                remove(partial)
+                make_dirs(partial)
+                extract_members(filename, partial, patterns, 'tarfile')
+            os.rename(partial, directory)
+            logger.info('End unpacking tar')
+        else:
+            logger.debug('Directory already exists: %s', directory)
     return directory
 
 
+def inflate_gzip(filename, fileobj, decompressor='auto'):
+    """Write the decompressed contents of a gzip file to fileobj."""
+    command = find_decompressor(decompressor)
+    if command is None:
+        with gzip.open(filename, 'rb') as source:
+            shutil.copyfileobj(source, fileobj, CHECKSUM_BLOCKSIZE)
+        return
+
+    logger.debug('Decompress with %s', ' '.join(command))
+    status = subprocess.call(command + [filename], stdout=fileobj)
+    if status != 0:
+        raise IOError('%s failed on %s with status %d'
+                      % (command[0], filename, status))
+
+
+def inflate_archive(filename, destination, decompressor='auto'):
+    """Decompress a tar.gz archive once into a plain tar.
+
+    Unlike the gzip stream, the plain tar can be read in place: GDAL's
+    /vsitar/ seeks from member header to member header rather than
+    inflating the archive from its start on every open.  As with
+    untar_archive, concurrent callers wait for the first decompression.
+
+    Args:
+        filename (str): path to tar.gz archive
+        destination (str): path to write the plain tar archive
+        decompressor (str): 'auto', 'igzip', 'pigz' or 'tarfile'
+
+    Returns:
+        str: path to the plain tar archive
+
+    """
+    with file_lock(destination + '.lock'):
+        if not os.path.isfile(destination):
+            partial = destination + '.partial'
+            logger.info('Decompressing tar: %s', filename)
+            try:
+                try:
+                    with open(partial, 'wb') as fid:
+                        inflate_gzip(filename, fid, decompressor)
+                except (IOError, OSError):
+                    if find_decompressor(decompressor) is None:
+                        raise
+                    logger.exception('External decompressor failed,'
+                                     ' retrying with gzip')
+                    with open(partial, 'wb') as fid:
+                        inflate_gzip(filename, fid, 'tarfile')
+                os.rename(partial, destination)
+            finally:
+                remove(partial)
+            logger.info('End decompressing tar')
+        else:
+            logger.debug('Archive already decompressed: %s', destination)
+    return destination
+
+
+def disk_free_mb(path):
+    """Free disk space available to the user at path, in megabytes."""
+    stats = os.statvfs(path)
+    return stats.f_bavail * stats.f_frsize // (1024 * 1024)
+
+
 def make_dirs(directory):
     """Create a directory if it does not already exist."""
     if not os.path.isdir(directory):
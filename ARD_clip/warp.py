@@ -0,0 +1,339 @@
+"""Clip and mosaic scene rasters onto the ARD tile grid."""
+
+import os
+
+from osgeo import gdal
+
+import util
+from util import logger
+
+
+BACKENDS = ('subprocess', 'inprocess')
+
+# GTiff creation option which sets the effort level of each codec
+LEVEL_OPTIONS = {
+    'deflate': 'zlevel',
+    'zstd': 'zstd_level',
+    'lzma': 'lzma_preset',
+}
+
+
+def has_inprocess_warp():
+    """Check whether the GDAL bindings provide the gdal.Warp utility API."""
+    return hasattr(gdal, 'Warp') and hasattr(gdal, 'WarpOptions')
+
+
+class OutputProfile(object):
+    """Encoding of the tile bands written to disk.
+
+    Without overview levels, bands are written as tiled GeoTIFFs.  With
+    them, bands are written cloud optimized, through the COG driver when
+    GDAL provides one (3.1+).  Otherwise the overviews are built in a
+    scratch GeoTIFF, as MEM datasets only support overviews from GDAL 2.1,
+    and copied into the file ahead of the full resolution blocks.
+
+    """
+
+    def __init__(self, compress='deflate', level=9, predictor=2,
+                 blocksize=None, overviews=(), resampling='nearest'):
+        """Describe the codec, block layout and overviews of each band.
+
+        Args:
+            compress (str): GTiff compression codec (e.g. 'deflate')
+            level (int): codec effort level, or None for its default
+            predictor (int): GTiff predictor, or None for none
+            blocksize (int): tile width and height, or None for default
+            overviews (tuple): overview decimation factors, e.g. (2, 4)
+            resampling (str): overview resampling method
+
+        """
+        self.compress = compress
+        self.level = level
+        self.predictor = predictor
+        self.blocksize = blocksize
+        self.overviews = tuple(overviews)
+        self.resampling = resampling
+
+    def gtiff_options(self):
+        """GTiff creation options for this profile."""
+        options = ['compress=' + self.compress]
+        level_option = LEVEL_OPTIONS.get(self.compress.lower())
+        if level_option and self.level is not None:
+            options.append('%s=%d' % (level_option, self.level))
+        options.append('tiled=yes')
+        if self.blocksize:
+            options += ['blockxsize=%d' % self.blocksize,
+                        'blockysize=%d' % self.blocksize]
+        if self.predictor:
+            options.append('predictor=%d' % self.predictor)
+        return options
+
+    def cog_options(self):
+        """COG driver creation options for this profile."""
+        options = ['compress=' + self.compress,
+                   'overview_resampling=' + self.resampling]
+        if self.level is not None:
+            options.append('level=%d' % self.level)
+        if self.blocksize:
+            options.append('blocksize=%d' % self.blocksize)
+        if self.predictor:
+            options.append('predictor=yes')
+        return options
+
+    def write(self, dataset, destination):
+        """Write dataset to destination in its final encoding.
+
+        Args:
+            dataset (gdal.Dataset): raster to write, preferably MEM
+            destination (str): path to output GeoTIFF
+
+        """
+        logger.debug('Write %s', destination)
+        scratch = None
+        if not self.overviews:
+            driver = gdal.GetDriverByName('GTiff')
+            options = self.gtiff_options()
+        elif gdal.GetDriverByName('COG') is not None:
+            driver = gdal.GetDriverByName('COG')
+            options = self.cog_options()
+        else:
+            scratch = destination.replace('.tif', '_overviews.tif')
+            dataset = self.build_overviews(dataset, scratch)
+            driver = gdal.GetDriverByName('GTiff')
+            options = self.gtiff_options() + ['copy_src_overviews=yes']
+
+        try:
+            output = driver.CreateCopy(destination, dataset, options=options)
+            if output is None:
+                raise IOError('Unable to write %s' % destination)
+            output = None  # Flush and close the output
+        finally:
+            if scratch is not None:
+                dataset = None
+                util.remove(scratch)
+
+    def build_overviews(self, dataset, scratch):
+        """Copy dataset to a scratch GeoTIFF and build its overviews there.
+
+        Args:
+            dataset (gdal.Dataset): raster to write
+            scratch (str): temporary GeoTIFF path
+
+        Returns:
+            gdal.Dataset: the scratch GeoTIFF, with overviews
+
+        """
+        util.remove(scratch)
+        copy = gdal.GetDriverByName('GTiff').CreateCopy(
+            scratch, dataset, options=['tiled=yes'])
+        if copy is None:
+            raise IOError('Unable to write %s' % scratch)
+        if copy.BuildOverviews(self.resampling.upper(),
+                               list(self.overviews)) != gdal.CE_None:
+            copy = None
+            util.remove(scratch)
+            raise RuntimeError('Unable to build overviews of %s' % scratch)
+        return copy
+
+
+class WarpEngine(object):
+    """Run gdalwarp-equivalent operations as a subprocess or in-process.
+
+    The 'subprocess' backend shells out to the gdalwarp executable, while
+    the 'inprocess' backend calls the same warper through gdal.Warp (GDAL
+    2.1+), avoiding a process spawn per band.
+
+    """
+
+    def __init__(self, backend='subprocess', profile=None):
+        """Select the warp backend, falling back to subprocess if needed."""
+        if backend not in BACKENDS:
+            raise ValueError('Unknown warp backend: %s' % backend)
+        if backend == 'inprocess' and not has_inprocess_warp():
+            logger.warning('GDAL %s does not provide gdal.Warp,'
+                           ' falling back to subprocess warping',
+                           gdal.VersionInfo('RELEASE_NAME'))
+            backend = 'subprocess'
+        self.backend = backend
+        self.profile = profile or OutputProfile()
+
+    def warp(self, sources, destination, extents=None, dst_nodata=None,
+             src_nodata=None, output_type=None, working_type=None,
+             creation_options=None, overwrite=False):
+        """Mosaic sources into destination, later sources drawn on top.
+
+        Args:
+            sources (list): paths to input rasters
+            destination (str): path to output GeoTIFF
+            extents (str): target extents as 'xmin ymin xmax ymax'
+            dst_nodata (str): output nodata value ('None' to unset)
+            src_nodata (str): input nodata value ('None' to ignore)
+            output_type (str): output GDAL data type name (e.g. 'Byte')
+            working_type (str): working GDAL data type name
+            creation_options (tuple): GTiff creation options, defaults
+                to those of the engine's output profile
+            overwrite (bool): replace destination if it already exists
+
+        Returns:
+            dict: exit status code and text output stream
+
+        """
+        if creation_options is None:
+            if self.profile.overviews:
+                return self.warp_profile(sources, destination, extents,
+                                         dst_nodata, src_nodata,
+                                         output_type, working_type)
+            creation_options = self.profile.gtiff_options()
+
+        if self.backend == 'inprocess':
+            return self.warp_inprocess(sources, destination, extents,
+                                       dst_nodata, src_nodata, output_type,
+                                       working_type, creation_options,
+                                       overwrite)
+
+        warp_cmd = ['gdalwarp']
+        if extents is not None:
+            warp_cmd += ['-te'] + extents.split()
+        if dst_nodata is not None:
+            warp_cmd += ['-dstnodata', str(dst_nodata)]
+        if src_nodata is not None:
+            warp_cmd += ['-srcnodata', str(src_nodata)]
+        if output_type is not None:
+            warp_cmd += ['-ot', output_type]
+        if working_type is not None:
+            warp_cmd += ['-wt', working_type]
+        for option in creation_options or ():
+            warp_cmd += ['-co', option]
+        if overwrite:
+            warp_cmd += ['-overwrite']
+        warp_cmd += list(sources) + [destination]
+        return util.execute_cmd(warp_cmd)
+
+    @staticmethod
+    def warp_options(extents=None, dst_nodata=None, src_nodata=None,
+                     output_type=None, working_type=None, **options):
+        """Translate gdalwarp style arguments into gdal.WarpOptions."""
+        if extents is not None:
+            options['outputBounds'] = [float(x) for x in extents.split()]
+        if dst_nodata is not None:
+            options['dstNodata'] = dst_nodata
+        if src_nodata is not None:
+            options['srcNodata'] = src_nodata
+        if output_type is not None:
+            options['outputType'] = gdal.GetDataTypeByName(output_type)
+        if working_type is not None:
+            options['workingType'] = gdal.GetDataTypeByName(working_type)
+        return gdal.WarpOptions(**options)
+
+    def warp_inprocess(self, sources, destination, extents, dst_nodata,
+                       src_nodata, output_type, working_type,
+                       creation_options, overwrite):
+        """Run the warp through gdal.Warp, mirroring the gdalwarp options."""
+        options = dict(format='GTiff', extents=extents,
+                       dst_nodata=dst_nodata, src_nodata=src_nodata,
+                       output_type=output_type, working_type=working_type,
+                       creationOptions=list(creation_options or ()))
+        if overwrite:
+            util.remove(destination)
+
+        logger.debug('gdal.Warp %s -> %s: %s', sources, destination, options)
+        status = 0
+        try:
+            dataset = gdal.Warp(destination, list(sources),
+                                options=self.warp_options(**options))
+            if dataset is None:
+                status = 1
+            dataset = None  # Flush and close the output
+        except RuntimeError:
+            logger.exception('gdal.Warp failed for %s', destination)
+            status = 1
+
+        if status != 0 or not os.path.exists(destination):
+            logger.error('gdal.Warp failed to write %s', destination)
+            status = status or 1
+        return {
+            'cmd': 'gdal.Warp',
+            'status': status,
+            'output': [],
+        }
+
+    def warp_profile(self, sources, destination, extents, dst_nodata,
+                     src_nodata, output_type, working_type):
+        """Warp in memory, then write the result through the profile."""
+        util.remove(destination)
+        status = 0
+        try:
+            dataset = self.warp_to_memory(
+                sources, destination.replace('.tif', '_scratch.tif'),
+                extents=extents, dst_nodata=dst_nodata,
+                src_nodata=src_nodata, output_type=output_type,
+                working_type=working_type)
+            self.profile.write(dataset, destination)
+        except (IOError, RuntimeError):
+            logger.exception('Unable to write %s', destination)
+            status = 1
+        return {
+            'cmd': 'warp_profile',
+            'status': status,
+            'output': [],
+        }
+
+    def warp_to_memory(self, sources, scratch, extents=None, dst_nodata=None,
+                       src_nodata=None, output_type=None, working_type=None):
+        """Mosaic sources into an in-memory dataset.
+
+        Args:
+            sources (list): paths to input rasters
+            scratch (str): temporary GeoTIFF path for the subprocess backend
+            (others): as for `warp`
+
+        Returns:
+            gdal.Dataset: MEM dataset holding the clipped mosaic
+
+        """
+        if self.backend == 'inprocess':
+            options = self.warp_options(extents, dst_nodata, src_nodata,
+                                        output_type, working_type,
+                                        format='MEM')
+            dataset = gdal.Warp('', list(sources),
+                                options=options)
+        else:
+            util.remove(scratch)
+            self.warp(sources, scratch, extents=extents,
+                      dst_nodata=dst_nodata, src_nodata=src_nodata,
+                      output_type=output_type, working_type=working_type,
+                      creation_options=())
+            dataset = gdal.Open(scratch)
+            if dataset is not None:
+                dataset = gdal.GetDriverByName('MEM').CreateCopy('', dataset)
+            util.remove(scratch)
+
+        if dataset is None:
+            raise IOError('Unable to clip %s' % ', '.join(sources))
+        return dataset
+
+    def write_array(self, array, template, destination, nodata=None,
+                    output_type=None):
+        """Write a single band array as a GeoTIFF in its final form.
+
+        Args:
+            array (numpy.ndarray): pixel values to write
+            template (gdal.Dataset): source of geolocation and data type
+            destination (str): path to output GeoTIFF
+            nodata (float): output nodata value, or None to leave unset
+            output_type (str): GDAL data type name, defaults to template's
+
+        """
+        rows, cols = array.shape
+        datatype = template.GetRasterBand(1).DataType
+        if output_type is not None:
+            datatype = gdal.GetDataTypeByName(output_type)
+        dataset = gdal.GetDriverByName('MEM').Create('', cols, rows, 1,
+                                                     datatype)
+        dataset.SetGeoTransform(template.GetGeoTransform())
+        dataset.SetProjection(template.GetProjection())
+        band = dataset.GetRasterBand(1)
+        if nodata is not None:
+            band.SetNoDataValue(nodata)
+        band.WriteArray(array)
+        self.profile.write(dataset, destination)
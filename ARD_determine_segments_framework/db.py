@@ -1,12 +1,29 @@
 """Methods for pre-defined database interactions."""
 
+import os
+import time
+import atexit
+
 import cx_Oracle
 
 from util import logger
 
 
+# Seconds a connection may sit unused before it is checked on reuse
+PING_INTERVAL = 60.0
+
+# Open connection of this process, and when it was last used, by connstr
+connections = dict()
+last_used = dict()
+
+
 def connect(connstr):
-    """Open a new Oracle DB connection.
+    """Get this process' Oracle DB connection, opening it if needed.
+
+    The framework polls the database from its main thread only, so one
+    connection per process is reused across polling cycles.  A connection
+    left unused for PING_INTERVAL seconds is checked before it is reused,
+    and replaced if it was dropped.
 
     Args:
         connstr (str): Oracle formatted connection string
@@ -19,11 +36,50 @@ def connect(connstr):
         <cx_Oracle.Connection to schema/secret@host:port/database>
 
     """
+    key = (os.getpid(), connstr)
+    connection = connections.get(key)
+    now = time.time()
+    if connection is not None:
+        idle = now - last_used.get(key, now)
+        last_used[key] = now
+        if idle < PING_INTERVAL:
+            return connection
+        try:
+            connection.ping()
+            return connection
+        except cx_Oracle.Error:
+            logger.warning('Database connection lost, reconnecting')
+            close(key)
+
     try:
-        return cx_Oracle.connect(connstr)
+        connection = cx_Oracle.connect(connstr)
     except Exception:
         logger.exception('Unable to connect to database!')
         raise
+    connections[key] = connection
+    last_used[key] = now
+    return connection
+
+
+def close(key):
+    """Close a cached connection, ignoring one that is already gone."""
+    connection = connections.pop(key, None)
+    last_used.pop(key, None)
+    if connection is not None:
+        try:
+            connection.close()
+        except cx_Oracle.Error:
+            pass
+
+
+def close_all():
+    """Close the connections opened by this process."""
+    for key in list(connections):
+        if key[0] == os.getpid():
+            close(key)
+
+
+atexit.register(close_all)
 
 
 def select(connection, sql, **opts):
@@ -88,12 +144,14 @@ def update_many(connection, sql, array=None):
     connection.commit()
 
 
-def set_scene_to_inqueue(connection, scene_id):
-    """Set 'BLANK' to 'INQUEUE' processing status by matching scene_id."""
+def set_scenes_to_inqueue(connection, scene_ids):
+    """Set 'BLANK' to 'INQUEUE' processing status of all scene_ids at once."""
     updatesql = ("update ARD_PROCESSED_SCENES "
                  "set PROCESSING_STATE = 'INQUEUE' "
                  "where scene_id = :scene_id")
-    update(connection, updatesql, scene_id=scene_id)
+    if scene_ids:
+        update_many(connection, updatesql,
+                    [{'scene_id': scene_id} for scene_id in scene_ids])
 
 
 def reset_records(connection):
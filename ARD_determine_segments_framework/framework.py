@@ -309,9 +309,9 @@ def queue_segments(jobs, conf, connection):
                            scene_record['FILE_LOC'])
                     completed_scene_list.append(row)
 
-                    # set 'BLANK' to 'INQUEUE' processing status
-                    db.set_scene_to_inqueue(connection,
-                                            scene_record['LANDSAT_PRODUCT_ID'])
+                # set 'BLANK' to 'INQUEUE' processing status, in one batch
+                db.set_scenes_to_inqueue(connection,
+                                         [r[0] for r in completed_scene_list])
                 logger.info("Scenes inserted into ARD_PROCESSED_SCENES table:"
                             " %s", completed_scene_list)
                 db.processed_scenes(connection, completed_scene_list)
@@ -333,7 +333,7 @@ def queue_segments(jobs, conf, connection):
                 cmd = ' '.join([
                     'cli.py', "'" +
                     json.dumps(segment, sort_keys=True, default=str) +
-                    "'", final_output
+                    "'", final_output, '--cpus', str(conf.cpus)
                 ])
                 job_id = format_job_id(segment)
                 logger.debug('Command to clip: [%s]', cmd)